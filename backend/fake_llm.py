@@ -0,0 +1,67 @@
+"""Offline stand-in for genai.GenerativeModel.
+
+Selected with FAKE_LLM=1: needs no API key or network, and answers in
+chunks of a few words, FAKE_LLM_DELAY_MS apart, so streaming,
+time-to-first-token, concurrency limits and client-disconnect cancellation
+can be exercised locally. With FAKE_LLM_FAILURE_RATE, that share of calls
+fails with a transient 503 to exercise retries. `generated` counts the
+chunks actually produced, which stops growing once a stream is cancelled.
+fake_embedding() stands in for the embedding model.
+"""
+import zlib
+import random
+import asyncio
+import numpy as np
+from google.api_core import exceptions
+
+def fake_embedding(text, dim=512):
+    """Hashed character-trigram vector: similar wording gives similar vectors."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        word = f" {word.strip('?!.,')} "
+        for i in range(len(word) - 2):
+            vector[zlib.crc32(word[i:i + 3].encode()) % dim] += 1.0
+    return vector
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class FakeStream:
+    """Async iterable of FakeChunk, cancellable like a gRPC stream."""
+
+    def __init__(self, model, words, delay):
+        self.model = model
+        self.words = words
+        self.delay = delay
+        self.cancelled = False
+
+    async def __aiter__(self):
+        for start in range(0, len(self.words), 3):
+            await asyncio.sleep(self.delay)
+            if self.cancelled:
+                return
+            self.model.generated += 1
+            yield FakeChunk(" ".join(self.words[start:start + 3]) + " ")
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeGenerativeModel:
+    def __init__(self, delay=0.05, words=60, failure_rate=0.0):
+        self.delay = delay
+        self.words = words
+        self.failure_rate = failure_rate
+        self.generated = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        if random.random() < self.failure_rate:
+            await asyncio.sleep(self.delay)
+            raise exceptions.ServiceUnavailable("Fake model is temporarily unavailable")
+        query = prompt.strip().splitlines()[-1].strip() if prompt.strip() else ""
+        words = f"Fake answer to: {query}.".split()
+        words += [f"word{i}" for i in range(max(self.words - len(words), 0))]
+        response = FakeStream(self, words, self.delay)
+        if stream:
+            return response
+        return FakeChunk("".join([chunk.text async for chunk in response]))
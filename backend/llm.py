@@ -0,0 +1,163 @@
+"""Async dispatch of Gemini calls with a concurrency limit.
+
+At most `max_in_flight` calls run at once; further callers wait in line,
+and once `max_queue` of them are waiting new calls are shed with
+Overloaded. Each attempt is bounded by `timeout` seconds, and transient
+failures (timeouts, 429s, 5xxs) are retried up to `retries` times after an
+exponential backoff with full jitter. For streamed calls the timeout covers
+the whole attempt, up to the last chunk, and a failure is only retried
+while no text has been passed on yet.
+
+Calls use the model's native async API (generate_content_async), so a
+slow Gemini answer never blocks the event loop.
+"""
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from google.api_core import exceptions
+
+RETRYABLE = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    exceptions.ResourceExhausted,
+    exceptions.TooManyRequests,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
+
+class Overloaded(Exception):
+    """Raised when too many calls are already waiting for a slot."""
+
+def cancel_generation(response):
+    """Cancel an unfinished streaming call so it stops generating (and billing) upstream."""
+    # genai wraps the gRPC stream in _iterator; the fake model cancels itself
+    stream = getattr(response, "_iterator", response)
+    cancel = getattr(stream, "cancel", None)
+    if callable(cancel):
+        cancel()
+
+class LLMDispatcher:
+    def __init__(self, model, max_in_flight=8, max_queue=64, timeout=60.0, retries=2,
+                 backoff=0.5, max_backoff=8.0):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the `max_in_flight` slots, waiting in line for it."""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Too many queued LLM calls")
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.perf_counter() - start
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def call(self, prompt, **kwargs):
+        """One model call with timeout and retries; the caller must hold a slot."""
+        for attempt in range(self.retries + 1):
+            self.calls += 1
+            try:
+                return await asyncio.wait_for(self.model.generate_content_async(prompt, **kwargs), self.timeout)
+            except RETRYABLE as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                if attempt == self.retries:
+                    self.failures += 1
+                    raise
+                self.retried += 1
+                await asyncio.sleep(self._delay(attempt))
+            except Exception:
+                self.failures += 1
+                raise
+
+    async def stream(self, prompt, **kwargs):
+        """Text chunks of one streamed model call; the caller must hold a slot.
+
+        Each attempt must deliver its last chunk within `timeout` seconds of
+        starting, so a stalled stream cannot hold its slot forever.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            self.calls += 1
+            deadline = loop.time() + self.timeout
+            response = None
+            emitted = False
+            complete = False
+            try:
+                response = await asyncio.wait_for(
+                    self.model.generate_content_async(prompt, stream=True, **kwargs), self.timeout)
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        emitted = True
+                        yield chunk.text
+                complete = True
+                return
+            except RETRYABLE as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.timeouts += 1
+                # Text already passed on cannot be taken back, so only a clean failure is retried
+                if emitted or attempt == self.retries:
+                    self.failures += 1
+                    raise
+                self.retried += 1
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                if not complete and response is not None:
+                    cancel_generation(response)
+            await asyncio.sleep(self._delay(attempt))
+
+    async def generate(self, prompt, **kwargs):
+        async with self.slot():
+            return await self.call(prompt, **kwargs)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "timeout_s": self.timeout,
+            "retries": self.retries,
+            "calls": self.calls,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
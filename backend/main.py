@@ -1,23 +1,90 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import google.generativeai as genai
 import os
+import sys
+import json
+import time
+import asyncio
+from contextlib import aclosing
 from dotenv import load_dotenv
 import uvicorn
+# Metrics are shared with the other services from the repository-level `shared` package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared.metrics import REGISTRY, STAGE_SECONDS, instrument, span
+from llm import LLMDispatcher, Overloaded
+from semantic_cache import SemanticCache, normalize_query
+from single_flight import SingleFlight
+from google.api_core.exceptions import GoogleAPIError
 
 load_dotenv()
 
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not found")
+FAKE_LLM = os.getenv("FAKE_LLM", "0") == "1"
+if FAKE_LLM:
+    # Local testing without a key: canned answers streamed FAKE_LLM_DELAY_MS apart
+    from fake_llm import FakeGenerativeModel, fake_embedding
+    gemini_model = FakeGenerativeModel(delay=int(os.getenv("FAKE_LLM_DELAY_MS", "50")) / 1000,
+                                       failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")))
+else:
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found")
 
-genai.configure(api_key=api_key)
-gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+    genai.configure(api_key=api_key)
+    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+
+# Concurrent Gemini calls, callers allowed to wait for one, and per-attempt timeout/retries
+llm = LLMDispatcher(
+    gemini_model,
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+    retries=int(os.getenv("LLM_RETRIES", "2")),
+)
+
+# Identical questions asked while one is being answered share that answer
+flights = SingleFlight()
+
+REGISTRY.gauge("llm_in_flight", "Gemini calls currently running", fn=lambda: llm.in_flight)
+REGISTRY.gauge("llm_queue_depth", "Chat requests waiting for a Gemini slot", fn=lambda: llm.waiting)
+REGISTRY.counter("llm_calls_total", "Gemini call attempts", fn=lambda: llm.calls)
+REGISTRY.counter("llm_retries_total", "Gemini calls retried after a transient error", fn=lambda: llm.retried)
+REGISTRY.counter("llm_timeouts_total", "Gemini call attempts that timed out", fn=lambda: llm.timeouts)
+REGISTRY.counter("llm_rejected_total", "Chat requests shed with 503 because the queue was full",
+                 fn=lambda: llm.rejected)
+# Answers reused for paraphrased questions on the same route; SEMANTIC_CACHE_SIZE=0 disables
+SEMANTIC_CACHE_EMBED_MODEL = os.getenv("SEMANTIC_CACHE_EMBED_MODEL", "models/text-embedding-004")
+semantic_cache = SemanticCache(
+    maxsize=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")) or None,
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+    path=os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.sqlite") or None,
+    # Stored vectors are only reused with the model that produced them
+    model="fake" if FAKE_LLM else SEMANTIC_CACHE_EMBED_MODEL,
+)
+
+REGISTRY.counter("semantic_cache_hits_total", "Chat answers served from the semantic cache",
+                 fn=lambda: semantic_cache.hits)
+REGISTRY.counter("semantic_cache_misses_total", "Chat questions that needed a Gemini answer",
+                 fn=lambda: semantic_cache.misses)
+REGISTRY.gauge("semantic_cache_hit_rate", "Semantic cache hit rate since start",
+               fn=lambda: semantic_cache.stats()["hit_rate"])
+REGISTRY.gauge("semantic_cache_entries", "Answers held by the semantic cache", fn=lambda: len(semantic_cache))
+REGISTRY.counter("chat_generations_started_total", "Chat answers started (after coalescing)",
+                 fn=lambda: flights.started)
+REGISTRY.counter("chat_requests_coalesced_total", "Chat requests that joined an identical in-flight answer",
+                 fn=lambda: flights.joined)
+STREAMS_CANCELLED = REGISTRY.counter("chat_streams_cancelled_total",
+                                     "Streamed answers abandoned by the client before completion")
 
 app = FastAPI(title="Physical AI Backend - Gemini Router", version="1.0.0")
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+# Stage timings, /metrics, and X-Profile: 1 sampling profiles when BACKEND_PROFILING=1
+instrument(app, enable_profiling=os.getenv("BACKEND_PROFILING", "0") == "1",
+           profile_dir=os.getenv("BACKEND_PROFILE_DIR", "profiles"))
 
 class QueryRequest(BaseModel):
     query: str
@@ -37,7 +104,7 @@ ROUTES = {
 
 @app.get("/")
 async def root():
-    return {"name": "Physical AI Backend", "version": "1.0.0", "endpoints": {"/api/chat": "POST", "/api/routes": "GET", "/health": "GET"}}
+    return {"name": "Physical AI Backend", "version": "1.0.0", "endpoints": {"/api/chat": "POST", "/api/chat/stream": "POST", "/api/routes": "GET", "/api/llm/stats": "GET", "/api/cache/stats": "GET", "/health": "GET", "/metrics": "GET"}}
 
 @app.get("/health")
 async def health():
@@ -47,8 +114,16 @@ async def health():
 async def get_routes():
     return {"available_routes": list(ROUTES.keys()), "model": "gemini-2.0-flash"}
 
-@app.post("/api/chat", response_model=RouterResponse)
-async def chat(req: QueryRequest):
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return {**llm.stats(), "single_flight": flights.stats()}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {"semantic_cache": semantic_cache.stats()}
+
+def build_prompt(req):
+    """Pick the route for a request and return (route, prompt)."""
     if req.route == "auto":
         if any(w in req.query.lower() for w in ["code", "python", "function"]):
             route = "code"
@@ -62,11 +137,133 @@ async def chat(req: QueryRequest):
         route = req.route if req.route in ROUTES else "content"
     
     system_prompt = ROUTES[route]
-    full_prompt = f"{system_prompt}\n\n{req.query}"
+    return route, f"{system_prompt}\n\n{req.query}"
+
+def generation_config():
+    return genai.types.GenerationConfig(max_output_tokens=2048)
+
+async def embed_query(query):
+    """Query embedding for the semantic cache, or None when it cannot be computed."""
+    if FAKE_LLM:
+        return fake_embedding(query)
+    try:
+        result = await asyncio.wait_for(asyncio.to_thread(
+            genai.embed_content, model=SEMANTIC_CACHE_EMBED_MODEL, content=query, task_type="retrieval_query"), 10)
+        return result["embedding"]
+    except Exception:
+        # The cache is an optimization; without an embedding the question is simply answered
+        return None
+
+async def lookup_answer(route, query):
+    """(cached answer or None, query embedding to store the answer under)."""
+    if semantic_cache.maxsize <= 0:
+        return None, None
+    with span("cache_lookup"):
+        answer = semantic_cache.get_exact(route, query)
+        if answer is not None:
+            return answer, None
+        vector = await embed_query(query)
+        hit = semantic_cache.get(route, vector)
+        return (hit[0] if hit else None), vector
+
+def join_answer(route, query, prompt):
+    """The shared answer for (route, normalized query), started if none is in flight.
+
+    The first caller's flight checks the semantic cache, otherwise streams the
+    answer from Gemini and caches it; the caller must leave() the flight.
+    """
+    async def produce():
+        cached, vector = await lookup_answer(route, query)
+        if cached is not None:
+            flight.cached = True
+            yield cached
+            return
+        parts = []
+        async with llm.slot():
+            # LLM_TIMEOUT bounds the whole stream, not just opening it
+            async with aclosing(llm.stream(prompt, generation_config=generation_config())) as chunks:
+                async for text in chunks:
+                    parts.append(text)
+                    yield text
+        semantic_cache.set(route, query, vector, "".join(parts))
+
+    flight = flights.join((route, normalize_query(query)), produce)
+    return flight
+
+@app.post("/api/chat", response_model=RouterResponse)
+async def chat(req: QueryRequest, response: Response):
+    with span("route"):
+        route, full_prompt = build_prompt(req)
     
-    response = gemini_model.generate_content(full_prompt, generation_config=genai.types.GenerationConfig(max_output_tokens=2048))
+    flight = join_answer(route, req.query, full_prompt)
+    try:
+        with span("generate"):
+            text = await flight.result()
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Gemini did not answer in time")
+    except GoogleAPIError as e:
+        raise HTTPException(status_code=502, detail=f"Gemini error: {e}")
+    finally:
+        flight.leave()
     
-    return RouterResponse(response=response.text, route=route, model="gemini-2.0-flash")
+    response.headers["X-Cache"] = "hit" if flight.cached else "miss"
+    with span("serialize"):
+        return RouterResponse(response=text, route=route, model="gemini-2.0-flash")
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class EventStream(StreamingResponse):
+    """StreamingResponse that closes its generator as soon as streaming stops.
+
+    Starlette only cancels the sending task when the client disconnects, so
+    without this the generator's cleanup would wait for garbage collection.
+    """
+    media_type = "text/event-stream"
+
+    async def stream_response(self, send):
+        try:
+            await super().stream_response(send)
+        finally:
+            await self.body_iterator.aclose()
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: QueryRequest):
+    """Server-sent events: `token` events as Gemini emits text, then `done` (or `error`)."""
+    with span("route"):
+        route, full_prompt = build_prompt(req)
+
+    async def events():
+        start = time.perf_counter()
+        flight = join_answer(route, req.query, full_prompt)
+        finished = False
+        try:
+            i = 0
+            while (text := await flight.next_chunk(i)) is not None:
+                if i == 0:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_token")
+                i += 1
+                yield sse("token", {"text": text})
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="generate")
+            finished = True
+            done = {"route": route, "model": "gemini-2.0-flash"}
+            yield sse("done", {**done, "cached": True} if flight.cached else done)
+        except asyncio.TimeoutError:
+            finished = True
+            yield sse("error", {"error": "Gemini did not answer in time"})
+        except Exception as e:
+            finished = True
+            yield sse("error", {"error": str(e)})
+        finally:
+            # Not finished means the client disconnected (cancellation or GeneratorExit);
+            # the generation itself stops once no other client is waiting for it
+            if not finished:
+                STREAMS_CANCELLED.inc()
+            flight.leave()
+
+    return EventStream(events(), headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     print("Starting server on http://0.0.0.0:8000")
@@ -0,0 +1,207 @@
+"""Semantic cache of chat answers.
+
+A lookup hits when an earlier query in the same namespace (the chat route)
+is at least `threshold` cosine-similar to the new one, so paraphrases of a
+question share one Gemini answer. Exact repeats (after normalizing case
+and whitespace) hit without needing an embedding at all.
+
+Entries are evicted least-recently-used beyond `maxsize` and dropped after
+`ttl` seconds. With a `path`, entries are kept in SQLite and reloaded on
+start, so the cache survives restarts.
+
+Vectors are only comparable within one embedding model, so every entry
+records the `model` it was embedded with and its dimension. Rows from
+another model are dropped on load, and a query vector is only scored
+against stored vectors of its own dimension. Any failure while scoring is
+reported as a miss: the cache must never be the reason a question fails.
+"""
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+class SemanticCache:
+    def __init__(self, maxsize=1000, ttl=None, threshold=0.9, path=None, model=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path
+        self.model = model
+        self._entries = OrderedDict()  # id -> {"namespace", "query", "vector", "answer", "created"}
+        self._exact = {}  # (namespace, normalized query) -> id
+        self._matrices = {}  # (namespace, dim) -> (ids, stacked vectors), rebuilt after changes
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, namespace TEXT, "
+                              "query TEXT, vector BLOB, answer TEXT, created REAL, used REAL, model TEXT, dim INTEGER)")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(answers)")}
+            for column, kind in (("model", "TEXT"), ("dim", "INTEGER")):
+                if column not in columns:
+                    # Files written before these columns existed: their rows load as another model's
+                    self.conn.execute(f"ALTER TABLE answers ADD COLUMN {column} {kind}")
+            self._load()
+
+    def _load(self):
+        rows = self.conn.execute("SELECT id, namespace, query, vector, answer, created, model, dim FROM answers "
+                                 "ORDER BY used").fetchall()
+        stale = []
+        for entry_id, namespace, query, vector, answer, created, model, dim in rows:
+            self._next_id = max(self._next_id, entry_id + 1)
+            vector = np.frombuffer(vector, dtype=np.float32) if vector else None
+            if vector is not None and (model != self.model or len(vector) != dim):
+                # Embedded by another model (or before models were recorded): not comparable
+                stale.append((entry_id,))
+                continue
+            self._add(entry_id, namespace, query, vector, json.loads(answer), created)
+        self.conn.executemany("DELETE FROM answers WHERE id = ?", stale)
+        self._evict()
+
+    def _add(self, entry_id, namespace, query, vector, answer, created):
+        self._entries[entry_id] = {"namespace": namespace, "query": query, "vector": vector,
+                                   "answer": answer, "created": created}
+        self._exact[(namespace, normalize_query(query))] = entry_id
+        self._forget_matrices(namespace)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        key = (entry["namespace"], normalize_query(entry["query"]))
+        if self._exact.get(key) == entry_id:
+            del self._exact[key]
+        self._forget_matrices(entry["namespace"])
+        if self.conn:
+            self.conn.execute("DELETE FROM answers WHERE id = ?", (entry_id,))
+
+    def _evict(self):
+        now = time.time()
+        if self.ttl:
+            for entry_id in [i for i, e in self._entries.items() if e["created"] + self.ttl <= now]:
+                self._remove(entry_id)
+                self.expirations += 1
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        if self.conn:
+            self.conn.commit()
+
+    def _forget_matrices(self, namespace):
+        for key in [k for k in self._matrices if k[0] == namespace]:
+            del self._matrices[key]
+
+    def _matrix(self, namespace, dim):
+        if (namespace, dim) not in self._matrices:
+            ids = [i for i, e in self._entries.items()
+                   if e["namespace"] == namespace and e["vector"] is not None and len(e["vector"]) == dim]
+            vectors = np.stack([self._entries[i]["vector"] for i in ids]) if ids else None
+            self._matrices[(namespace, dim)] = (ids, vectors)
+        return self._matrices[(namespace, dim)]
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _touch(self, entry_id):
+        self._entries.move_to_end(entry_id)
+        if self.conn:
+            self.conn.execute("UPDATE answers SET used = ? WHERE id = ?", (time.time(), entry_id))
+            self.conn.commit()
+
+    def _live(self, entry_id):
+        entry = self._entries[entry_id]
+        if self.ttl and entry["created"] + self.ttl <= time.time():
+            self._remove(entry_id)
+            self.expirations += 1
+            if self.conn:
+                self.conn.commit()
+            return False
+        return True
+
+    def get_exact(self, namespace, query):
+        """The answer stored for this very query, without embedding it."""
+        with self._lock:
+            entry_id = self._exact.get((namespace, normalize_query(query)))
+            if entry_id is None or not self._live(entry_id):
+                return None
+            self._touch(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]["answer"]
+
+    def get(self, namespace, vector):
+        """(answer, similarity) of the most similar stored query above the threshold, or None."""
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            try:
+                vector = self._normalize(vector)
+                ids, matrix = self._matrix(namespace, len(vector))
+                if not ids:
+                    self.misses += 1
+                    return None
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+            except Exception as e:
+                print(f"Semantic cache lookup failed, treating it as a miss: {e}")
+                self.misses += 1
+                return None
+            if scores[best] < self.threshold or not self._live(ids[best]):
+                self.misses += 1
+                return None
+            self._touch(ids[best])
+            self.hits += 1
+            self.semantic_hits += 1
+            return self._entries[ids[best]]["answer"], float(scores[best])
+
+    def set(self, namespace, query, vector, answer):
+        # An empty answer is a failed generation, not something to replay
+        if self.maxsize <= 0 or not answer or not str(answer).strip():
+            return
+        vector = self._normalize(vector) if vector is not None else None
+        now = time.time()
+        with self._lock:
+            previous = self._exact.get((namespace, normalize_query(query)))
+            if previous is not None:
+                self._remove(previous)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._add(entry_id, namespace, query, vector, answer, now)
+            if self.conn:
+                self.conn.execute("INSERT INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (entry_id, namespace, query, vector.tobytes() if vector is not None else None,
+                                   json.dumps(answer), now, now, self.model,
+                                   len(vector) if vector is not None else None))
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "model": self.model,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "disk": self.path,
+            }
@@ -0,0 +1,94 @@
+"""Coalescing of identical in-flight generations.
+
+The first caller for a key starts one upstream generation as a background
+task (a Flight); identical callers that arrive while it runs join it
+instead of starting their own. Every member reads the flight's text chunks
+from the beginning, so streaming and non-streaming callers can share one
+generation, and late joiners still get the whole answer. The generation
+is cancelled only once every member has left before it finished.
+"""
+import asyncio
+
+class Flight:
+    def __init__(self):
+        self.chunks = []
+        self.cached = False  # set by the producer when the answer came from a cache
+        self.done = False
+        self.error = None
+        self.members = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _publish(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def next_chunk(self, i):
+        """Chunk `i` once it exists, or None when the generation is complete."""
+        while i >= len(self.chunks) and not self.done:
+            await self._changed.wait()
+        if i < len(self.chunks):
+            return self.chunks[i]
+        if self.error is not None:
+            raise self.error
+        return None
+
+    async def result(self):
+        while not self.done:
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+        return "".join(self.chunks)
+
+    def leave(self):
+        self.members -= 1
+        if self.members == 0 and not self.done:
+            # Nobody is listening any more: stop generating upstream
+            self.task.cancel()
+
+class SingleFlight:
+    def __init__(self):
+        self.flights = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key, produce):
+        """The flight for `key`, started with `produce()` if none is running.
+
+        `produce` is an async generator function yielding text chunks. The
+        caller becomes a member and must call flight.leave() when done.
+        """
+        flight = self.flights.get(key)
+        if flight is None or flight.members == 0:
+            # No flight, or one whose members all left: it is being cancelled and
+            # will end in ConnectionAbortedError, so start a fresh one instead
+            flight = self.flights[key] = Flight()
+            flight.task = asyncio.create_task(self._run(flight, produce))
+            # A done callback rather than a finally: a task cancelled before it first
+            # runs never executes _run's body, but still has to leave the table
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.joined += 1
+        flight.members += 1
+        return flight
+
+    async def _run(self, flight, produce):
+        try:
+            async for text in produce():
+                flight.chunks.append(text)
+                flight._publish()
+        except asyncio.CancelledError:
+            flight.error = ConnectionAbortedError("Generation cancelled")
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight._publish()
+
+    def _forget(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self):
+        return {"in_flight": len(self.flights), "started": self.started, "coalesced": self.joined}
@@ -0,0 +1,290 @@
+"""In-process request metrics, stage timing spans and an on-demand profiler.
+
+Stages are timed with `span("embed")`; each span feeds the stage histogram
+and the current request's Server-Timing header. instrument(app) adds the
+middleware that counts in-flight requests, times whole requests (including
+streamed bodies), honours the opt-in `X-Profile` header, and serves
+everything in Prometheus text format on /metrics. Metrics are per process.
+
+Shared by rag_chatbot/api.py, backend/main.py and book/api/index.py. Only
+instrument() needs FastAPI, so the Vercel function can use the rest with
+the standard library alone. Vercel deploys only book/, so the function
+imports book/api/_metrics.py, an exact copy of this file: after editing
+here, copy it over (tests/test_metrics.py fails while they differ).
+"""
+import os
+import sys
+import time
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # Optional callback returning a value, or {label values tuple: value}, at scrape time
+        self.fn = fn
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        if self.fn is None:
+            with self.lock:
+                return list(self.values.items())
+        value = self.fn()
+        return list(value.items()) if isinstance(value, dict) else [((), value)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {float(value)}")
+        return lines
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        with self.lock:
+            self.values[self._key(labels)] += amount
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1.0, **labels):
+        with self.lock:
+            self.values[self._key(labels)] += amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _labels(self.labelnames + ("le",), key + (repr(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames + ("le",), key + ("+Inf",))
+            lines.append(f"{self.name}_bucket{labels} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None):
+        return self._add(CounterMetric(name, help, labelnames, fn))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self._add(GaugeMetric(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(HistogramMetric(name, help, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing callback (e.g. during startup) must not break the scrape
+                continue
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("stage_duration_seconds", "Time spent in each request stage", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "Request latency",
+                                     ["method", "path", "status"])
+IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests currently being served")
+
+# (stage, seconds) pairs of the request being served, for its Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+@contextmanager
+def request_timings():
+    """Collect the spans of the request being served into the yielded list."""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+@contextmanager
+def span(stage):
+    """Time a block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+def server_timing(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings)
+
+class SamplingProfiler:
+    """Sample every thread's Python stack at a fixed interval while running.
+
+    The result is in collapsed-stack ("folded") format, one line per unique
+    stack with its sample count, as read by flamegraph.pl and speedscope.
+    Stacks are rooted at the thread name, since concurrent requests and
+    helper threads (e.g. the micro-batcher) are sampled too.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class TimingMiddleware:
+    """ASGI middleware timing each request until its last body byte is sent.
+
+    Streaming responses (e.g. server-sent events) stay in flight and are
+    timed until the stream ends, not just until their headers go out.
+    """
+
+    def __init__(self, app, enable_profiling=False, profile_dir="profiles"):
+        self.app = app
+        self.enable_profiling = enable_profiling
+        self.profile_dir = profile_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        profiler = None
+        if self.enable_profiling and (b"x-profile", b"1") in scope["headers"]:
+            profiler = SamplingProfiler().start()
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(profiler):x}.folded"
+        status = 500
+
+        with request_timings() as timings:
+            async def send_with_headers(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = list(message.get("headers", []))
+                    if timings:
+                        headers.append((b"server-timing", server_timing(timings).encode("latin-1")))
+                    if profiler:
+                        headers.append((b"x-profile-file", name.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            IN_FLIGHT.inc()
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                IN_FLIGHT.dec()
+                route = scope.get("route")
+                REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"],
+                                        path=getattr(route, "path", "unmatched"), status=status)
+                if profiler:
+                    profiler.stop()
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    with open(os.path.join(self.profile_dir, name), "w", encoding="utf-8") as f:
+                        f.write(profiler.folded())
+
+def instrument(app, enable_profiling=False, profile_dir="profiles", registry=REGISTRY):
+    """Add timing middleware and a Prometheus /metrics endpoint to a FastAPI app.
+
+    With `enable_profiling`, a request carrying `X-Profile: 1` is profiled and
+    its folded stacks are written to `profile_dir`; the response names the
+    file in `X-Profile-File`.
+    """
+    from fastapi.responses import PlainTextResponse
+
+    app.add_middleware(TimingMiddleware, enable_profiling=enable_profiling, profile_dir=profile_dir)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    return app
@@ -1,87 +1,576 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import re
+import sys
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, OrderedDict
 import google.generativeai as genai
 from pathlib import Path
 
+# _metrics.py is a byte-for-byte copy of shared/metrics.py: the function is deployed
+# with book/ as its root, so nothing outside book/ is available at runtime
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _metrics import IN_FLIGHT, REGISTRY, STAGE_SECONDS, SamplingProfiler, request_timings, server_timing, span
+
+class FakeStream:
+    """Canned answer in chunks of a few words, cancellable like a Gemini stream."""
+
+    def __init__(self, words, delay):
+        self.words = words
+        self.delay = delay
+        self.cancelled = threading.Event()
+
+    def __iter__(self):
+        for start in range(0, len(self.words), 3):
+            if self.cancelled.wait(self.delay):
+                return
+            yield type("Chunk", (), {"text": " ".join(self.words[start:start + 3]) + " "})()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def text(self):
+        return "".join(chunk.text for chunk in self)
+
+class FakeModel:
+    """Offline stand-in for Gemini (FAKE_LLM=1), for testing streaming locally."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def generate_content(self, prompt, stream=False):
+        query = prompt.strip().splitlines()[-1].strip()
+        return FakeStream(f"Fake answer to: {query}.".split() + [f"word{i}" for i in range(50)], self.delay)
+
 # Initialize Gemini
 api_key = os.environ.get("GEMINI_API_KEY")
-if api_key:
+if os.environ.get("FAKE_LLM", "0") == "1":
+    model = FakeModel(int(os.environ.get("FAKE_LLM_DELAY_MS", "50")) / 1000)
+elif api_key:
     genai.configure(api_key=api_key)
     model = genai.GenerativeModel('gemini-2.0-flash')
 else:
     model = None
 
-def get_book_context():
-    """Read all markdown docs to build context"""
-    context = ""
-    # Path relative to api/index.py: we are in book/api, docs are in book/docs
-    docs_path = Path(__file__).parent.parent / "docs"
-    if docs_path.exists():
-        for md_file in docs_path.glob("*.md"):
+# Stage timings, kept per warm function instance and served on /api/metrics in
+# Prometheus text format by the same metrics module as the other services.
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+STREAMS_CANCELLED = REGISTRY.counter("chat_streams_cancelled_total",
+                                     "Streamed answers abandoned by the client before completion")
+REGISTRY.counter("semantic_cache_hits_total", "Chat answers served from the semantic cache",
+                 fn=lambda: answer_cache.hits)
+REGISTRY.counter("semantic_cache_misses_total", "Chat questions that needed a Gemini answer",
+                 fn=lambda: answer_cache.misses)
+REGISTRY.gauge("semantic_cache_entries", "Answers held by the semantic cache", fn=lambda: len(answer_cache.entries))
+
+# Path relative to api/index.py: we are in book/api, docs are in book/docs
+DOCS_PATH = Path(__file__).parent.parent / "docs"
+# Prompt context: at most CONTEXT_TOP_K chunks and CONTEXT_TOKEN_BUDGET (estimated) tokens
+CONTEXT_TOP_K = int(os.environ.get("CONTEXT_TOP_K", "8"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+CHUNK_WORDS = 180
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it its of on or "
+    "that the their this to was what when where which who why with".split()
+)
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+HEADING_RE = re.compile(r"^#{1,6}\s+(.*)")
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text):
+    # About four characters per token for English prose and code
+    return len(text) // 4 + 1
+
+def split_chunks(name, text):
+    """Chunks of about CHUNK_WORDS words that stay within one section and keep code fences whole."""
+    if text.startswith("---"):
+        parts = text.split("---", 2)
+        if len(parts) == 3 and not parts[0].strip():
+            text = parts[2]
+    chunks = []
+    heading = ""
+    paragraph = []
+    current = []
+    words = 0
+    in_fence = False
+
+    def flush_chunk():
+        nonlocal current, words
+        if current:
+            chunks.append({"file": name, "heading": heading, "text": "\n\n".join(current)})
+        current, words = [], 0
+
+    def flush_paragraph():
+        nonlocal words
+        block = "\n".join(paragraph).strip()
+        paragraph.clear()
+        if not block:
+            return
+        n = len(block.split())
+        if current and words + n > CHUNK_WORDS:
+            flush_chunk()
+        current.append(block)
+        words += n
+
+    for line in text.splitlines():
+        if line.strip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_RE.match(line)
+        if match:
+            flush_paragraph()
+            flush_chunk()
+            heading = match.group(1).strip()
+            current.append(line.strip())
+        elif not line.strip() and not in_fence:
+            flush_paragraph()
+        else:
+            paragraph.append(line)
+    flush_paragraph()
+    flush_chunk()
+    return chunks
+
+class BookIndex:
+    """Docs parsed into chunks with a BM25 index, rebuilt only when a file changes."""
+
+    def __init__(self, docs_path=DOCS_PATH):
+        self.docs_path = docs_path
+        self.signature = None
+        self.version = None
+        self.chunks = []
+        self.postings = {}
+
+    def _signature(self):
+        if not self.docs_path.exists():
+            return ()
+        return tuple(sorted((f.name, f.stat().st_mtime_ns, f.stat().st_size) for f in self.docs_path.glob("*.md")))
+
+    def refresh(self):
+        signature = self._signature()
+        if signature == self.signature:
+            return
+        chunks = []
+        for name, _, _ in signature:
             try:
-                content = md_file.read_text(encoding='utf-8')
-                context += f"\n--- DOCUMENT: {md_file.name} ---\n{content}\n"
-            except:
+                chunks.extend(split_chunks(name, (self.docs_path / name).read_text(encoding='utf-8')))
+            except (OSError, UnicodeDecodeError):
                 pass
+        # Precompute BM25 weights per (term, chunk) so a query is a few dict lookups
+        tfs = [Counter(tokenize(f"{c['heading']} {c['text']}")) for c in chunks]
+        lengths = [sum(tf.values()) for tf in tfs]
+        avgdl = sum(lengths) / len(lengths) if lengths else 0.0
+        df = Counter(term for tf in tfs for term in tf)
+        postings = {}
+        for i, (tf, length) in enumerate(zip(tfs, lengths)):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl) if avgdl else BM25_K1
+            for term, count in tf.items():
+                idf = math.log(1 + (len(chunks) - df[term] + 0.5) / (df[term] + 0.5))
+                postings.setdefault(term, []).append((i, idf * count * (BM25_K1 + 1) / (count + norm)))
+        self.chunks, self.postings, self.signature = chunks, postings, signature
+        self.version = hashlib.sha1(repr(signature).encode()).hexdigest()[:16]
+
+    def embed_query(self, query):
+        # No embeddings without the artifact: the answer cache then matches exact repeats only
+        return None
+
+    def search(self, query):
+        """Chunk indices, best BM25 match first."""
+        scores = Counter()
+        for term in set(tokenize(query)):
+            for i, weight in self.postings.get(term, ()):
+                scores[i] += weight
+        return [i for i, _ in scores.most_common()]
+
+class RetrievalArtifact:
+    """Prebuilt index from rag_chatbot/export_artifact.py, loaded with NumPy only.
+
+    BM25 over the indexer's chunks, fused by reciprocal rank with a dense
+    ranking whose query vector is the IDF-weighted mean of static term
+    embeddings. The artifact is fixed per deployment, so refresh() is a no-op.
+    """
+
+    RRF_K = 60
+    DEPTH = 50
+
+    def __init__(self, path):
+        import numpy as np
+
+        self.np = np
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        self.meta = json.loads(arrays["meta"].tobytes())
+        self.version = str(self.meta.get("version") or self.meta["created"])
+        self.terms = {term: i for i, term in enumerate(json.loads(arrays["terms"].tobytes()))}
+        self.chunks = json.loads(arrays["chunks"].tobytes())
+        self.indptr, self.rows, self.weights = arrays["indptr"], arrays["rows"], arrays["weights"]
+        self.idf = arrays["idf"]
+        self.term_vectors = arrays.get("term_vectors")
+        self.chunk_vectors = arrays.get("chunk_vectors")
+        if self.chunk_vectors is not None:
+            self.chunk_vectors = self.chunk_vectors.astype(np.float32)
+
+    def refresh(self):
+        pass
+
+    def embed(self, term_ids):
+        """IDF-weighted mean of the terms' static embeddings, normalized."""
+        np = self.np
+        vector = (self.idf[term_ids, None] * self.term_vectors[term_ids].astype(np.float32)).sum(axis=0)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def embed_query(self, query):
+        term_ids = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        return self.embed(term_ids) if term_ids and self.term_vectors is not None else None
+
+    def search(self, query):
+        np = self.np
+        term_ids = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        if not term_ids or not self.chunks:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for t in term_ids:
+            start, end = self.indptr[t], self.indptr[t + 1]
+            scores[self.rows[start:end]] += self.weights[start:end]
+        rankings = [[int(i) for i in np.argsort(-scores)[:self.DEPTH] if scores[i] > 0]]
+        if self.term_vectors is not None:
+            rankings.append([int(i) for i in np.argsort(-(self.chunk_vectors @ self.embed(term_ids)))[:self.DEPTH]])
+        fused = Counter()
+        for ranking in rankings:
+            for rank, i in enumerate(ranking):
+                fused[i] += 1.0 / (self.RRF_K + rank + 1)
+        return [i for i, _ in fused.most_common()]
+
+# Built by rag_chatbot/export_artifact.py; without it the docs are parsed at runtime
+RETRIEVAL_ARTIFACT = Path(__file__).parent / "retrieval_index.npz"
+retriever = None
+
+def get_retriever():
+    global retriever
+    if retriever is None:
+        retriever = RetrievalArtifact(RETRIEVAL_ARTIFACT) if RETRIEVAL_ARTIFACT.exists() else BookIndex()
+    return retriever
+
+def get_book_context(query, top_k=CONTEXT_TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+    """The chunks most relevant to the query, within the token budget, in book order"""
+    book_index = get_retriever()
+    book_index.refresh()
+    ranked = book_index.search(query)
+    if not ranked:
+        # Nothing matched: fall back to the start of each chapter
+        seen = set()
+        ranked = [i for i, c in enumerate(book_index.chunks) if not (c["file"] in seen or seen.add(c["file"]))]
+    chosen = []
+    used = 0
+    for i in ranked:
+        if len(chosen) >= top_k:
+            break
+        cost = estimate_tokens(book_index.chunks[i]["text"])
+        if used + cost > token_budget:
+            continue
+        chosen.append(i)
+        used += cost
+    context = ""
+    for i in sorted(chosen):
+        chunk = book_index.chunks[i]
+        section = f" ({chunk['heading']})" if chunk["heading"] else ""
+        context += f"\n--- DOCUMENT: {chunk['file']}{section} ---\n{chunk['text']}\n"
     return context
 
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def key_terms(query):
+    """Content words of a question, with plurals folded."""
+    return frozenset(t[:-1] if len(t) > 3 and t.endswith("s") else t for t in tokenize(query))
+
+def swaps_terms(a, b):
+    """Whether each of two questions has a key term the other lacks.
+
+    "How does the knee motor work?" and "How does the hip motor work?" swap
+    one subject for another, so they ask different things however similar
+    their embeddings are. A paraphrase may add or drop words ("How does a
+    humanoid robot keep balance?" for "How do humanoids balance?") but
+    does not replace one.
+    """
+    a, b = key_terms(a), key_terms(b)
+    return bool(a - b) and bool(b - a)
+
+class AnswerCache:
+    """Answers reused for repeated and paraphrased questions.
+
+    Entries are namespaced by the retriever's version, so answers never
+    outlive the book content they were generated from. A question hits when
+    it matches a stored one exactly (after normalizing case and spacing), or
+    when its embedding is at least `threshold` cosine-similar and neither
+    question swaps a key term for another (see swaps_terms). Static
+    bag-of-words embeddings score "the knee motor" and "the hip motor" as
+    near-identical, so similarity alone is not enough.
+    Empty answers are never stored. LRU beyond
+    `maxsize`, dropped after `ttl` seconds, and kept in SQLite at `path`
+    (on Vercel only /tmp is writable, so this survives per warm instance).
+    """
+
+    def __init__(self, maxsize=500, ttl=None, threshold=0.95, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.entries = OrderedDict()  # (namespace, normalized query) -> (vector, answer, created)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if path and maxsize > 0:
+            try:
+                self.conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+                self.conn.execute("CREATE TABLE IF NOT EXISTS answers (namespace TEXT, query TEXT, vector TEXT, "
+                                  "answer TEXT, created REAL, used REAL, PRIMARY KEY (namespace, query))")
+                for namespace, query, vector, answer, created in self.conn.execute(
+                        "SELECT namespace, query, vector, answer, created FROM answers ORDER BY used"):
+                    vector = json.loads(vector)
+                    if vector is not None:
+                        import numpy as np
+                        vector = np.asarray(vector, dtype=np.float32)
+                    self.entries[(namespace, query)] = (vector, answer, created)
+                self._evict()
+            except sqlite3.Error:
+                self.conn = None
+
+    def _drop(self, key):
+        del self.entries[key]
+        if self.conn:
+            self.conn.execute("DELETE FROM answers WHERE namespace = ? AND query = ?", key)
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (_, _, created) in self.entries.items() if self.ttl and created + self.ttl <= now]:
+            self._drop(key)
+        while len(self.entries) > self.maxsize:
+            self._drop(next(iter(self.entries)))
+        if self.conn:
+            self.conn.commit()
+
+    def get(self, namespace, query, vector):
+        """The stored answer for this or a similar enough question, or None."""
+        if self.maxsize <= 0:
+            return None
+        with self.lock:
+            self._evict()
+            key = (namespace, normalize_query(query))
+            if key not in self.entries and vector is not None:
+                import numpy as np
+                candidates = [(k, v) for k, (v, _, _) in self.entries.items()
+                              if k[0] == namespace and v is not None and not swaps_terms(query, k[1])]
+                if candidates:
+                    scores = np.stack([v for _, v in candidates]) @ np.asarray(vector, dtype=np.float32)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        key = candidates[best][0]
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            if self.conn:
+                self.conn.execute("UPDATE answers SET used = ? WHERE namespace = ? AND query = ?", (time.time(), *key))
+                self.conn.commit()
+            self.hits += 1
+            return self.entries[key][1]
+
+    def set(self, namespace, query, vector, answer):
+        if self.maxsize <= 0 or not answer or not answer.strip():
+            return
+        key = (namespace, normalize_query(query))
+        now = time.time()
+        with self.lock:
+            self.entries[key] = (vector, answer, now)
+            self.entries.move_to_end(key)
+            if self.conn:
+                stored = json.dumps([round(float(x), 5) for x in vector] if vector is not None else None)
+                self.conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                                  (*key, stored, answer, now, now))
+            self._evict()
+
+answer_cache = AnswerCache(
+    maxsize=int(os.environ.get("SEMANTIC_CACHE_SIZE", "500")),
+    ttl=float(os.environ.get("SEMANTIC_CACHE_TTL", "86400")) or None,
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    path=os.environ.get("SEMANTIC_CACHE_PATH", "/tmp/semantic_cache.sqlite") or None,
+)
+
+def lookup_answer(query):
+    """(namespace, query embedding, cached answer or None) for a question."""
+    book_index = get_retriever()
+    book_index.refresh()
+    vector = book_index.embed_query(query)
+    return book_index.version, vector, answer_cache.get(book_index.version, query, vector)
+
+def build_prompt(query, context):
+    return f"""
+            You are an expert AI Assistant specialized in the "Physical AI: Humanoid Robotics" book.
+            Use the following book content to provide exact, factual answers. 
+            If the answer isn't in the context, say you don't know based on the book.
+            Keep answers concise and well-formatted in markdown.
+            
+            BOOK CONTEXT:
+            {context}
+            
+            USER QUERY: {query}
+            """
+
+def cancel_generation(response):
+    """Cancel an unfinished streaming call so it stops generating (and billing) upstream."""
+    # genai wraps the gRPC stream in _iterator; the fake model cancels itself
+    stream = getattr(response, "_iterator", response)
+    cancel = getattr(stream, "cancel", None)
+    if callable(cancel):
+        cancel()
+
 class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/api/metrics':
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4')
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
     def do_POST(self):
         if self.path == '/api/chat':
             content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            query = data.get('query', '')
-
-            if not model:
-                # If no key, try to at least provide a helpful message
-                response_data = {"results": [{"title": "System Error", "content": "GEMINI_API_KEY is missing in Vercel Environment Variables.", "score": 0.0}]}
-                self.send_response(200) # Send 200 so frontend shows the message
-            else:
-                try:
-                    context = get_book_context()
-                    prompt = f"""
-                    You are an expert AI Assistant specialized in the "Physical AI: Humanoid Robotics" book.
-                    Use the following book content to provide exact, factual answers. 
-                    If the answer isn't in the context, say you don't know based on the book.
-                    Keep answers concise and well-formatted in markdown.
-                    
-                    BOOK CONTEXT:
-                    {context}
-                    
-                    USER QUERY: {query}
-                    """
-                    
-                    response = model.generate_content(prompt)
-                    
-                    response_data = {
-                        "results": [
-                            {
-                                "title": "AI Assistant Response",
-                                "content": response.text,
-                                "score": 1.0
-                            }
-                        ]
-                    }
-                    self.send_response(200)
-                except Exception as e:
-                    response_data = {"results": [{"title": "API Error", "content": str(e), "score": 0.0}]}
-                    self.send_response(200)
+            data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            if data.get('stream') or 'text/event-stream' in self.headers.get('Accept', ''):
+                self.stream_answer(data.get('query', ''))
+                return
+            IN_FLIGHT.inc()
+            profiler = SamplingProfiler().start() if PROFILING and self.headers.get('X-Profile') == '1' else None
+            try:
+                with request_timings() as timings:
+                    response_data, cache_status = self.answer(data.get('query', ''))
+                    with span("serialize"):
+                        body = json.dumps(response_data).encode('utf-8')
+            finally:
+                IN_FLIGHT.dec()
+                if profiler:
+                    profiler.stop()
+            if profiler:
+                response_data["profile"] = profiler.folded()
+                body = json.dumps(response_data).encode('utf-8')
+            self.send_response(200) # Errors are sent as 200 so the frontend shows the message
 
             self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            self.send_cors_headers()
+            if cache_status:
+                self.send_header('X-Cache', cache_status)
+            self.send_header('Server-Timing', server_timing(timings))
             self.end_headers()
-            self.wfile.write(json.dumps(response_data).encode('utf-8'))
+            self.wfile.write(body)
         else:
             self.send_response(404)
             self.end_headers()
 
-    def do_OPTIONS(self):
-        self.send_response(200)
+    def answer(self, query):
+        """The response body and its X-Cache status (None when the cache was not consulted)."""
+        if not model:
+            # If no key, try to at least provide a helpful message
+            return {"results": [{"title": "System Error", "content": "GEMINI_API_KEY is missing in Vercel Environment Variables.", "score": 0.0}]}, None
+        try:
+            with span("cache_lookup"):
+                namespace, vector, text = lookup_answer(query)
+            cache_status = "hit" if text is not None else "miss"
+            if text is None:
+                with span("context"):
+                    context = get_book_context(query)
+                
+                with span("generate"):
+                    response = model.generate_content(build_prompt(query, context))
+                    text = response.text
+                answer_cache.set(namespace, query, vector, text)
+            
+            return {
+                "results": [
+                    {
+                        "title": "AI Assistant Response",
+                        "content": text,
+                        "score": 1.0
+                    }
+                ]
+            }, cache_status
+        except Exception as e:
+            return {"results": [{"title": "API Error", "content": str(e), "score": 0.0}]}, None
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def stream_answer(self, query):
+        """Server-sent events: `token` events as Gemini emits text, then `done` (or `error`).
+
+        A failed write means the client went away; the upstream stream is then
+        cancelled instead of being read to the end.
+        """
+        IN_FLIGHT.inc()
+        response = None
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.send_cors_headers()
+            self.end_headers()
+            if not model:
+                self.send_event("error", {"error": "GEMINI_API_KEY is missing in Vercel Environment Variables."})
+                return
+            with span("cache_lookup"):
+                namespace, vector, cached = lookup_answer(query)
+            if cached is not None:
+                self.send_event("token", {"text": cached})
+                self.send_event("done", {"cached": True})
+                return
+            with span("context"):
+                context = get_book_context(query)
+            start = time.perf_counter()
+            parts = []
+            try:
+                response = model.generate_content(build_prompt(query, context), stream=True)
+                for i, chunk in enumerate(response):
+                    if i == 0:
+                        STAGE_SECONDS.observe(time.perf_counter() - start, stage="first_token")
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        self.send_event("token", {"text": chunk.text})
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                self.send_event("error", {"error": str(e)})
+                return
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="generate")
+            answer_cache.set(namespace, query, vector, "".join(parts))
+            self.send_event("done", {})
+        except (BrokenPipeError, ConnectionResetError):
+            STREAMS_CANCELLED.inc()
+            if response is not None:
+                cancel_generation(response)
+        finally:
+            IN_FLIGHT.dec()
+
+    def send_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Profile')
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_cors_headers()
         self.end_headers()
@@ -1,26 +1,20 @@
-import requests
-import json
+import httpx
+from rag_client import RAGClient
 
 # Configuration
 # If running on the same machine:
-API_URL = "http://localhost:8000/search"
+API_URL = "http://localhost:8000"
 # If running on a different machine, replace localhost with the IP, e.g.:
-# API_URL = "http://192.168.1.5:8000/search"
+# API_URL = "http://192.168.1.5:8000"
+
+# One client for the whole program: it keeps connections open between calls
+client = RAGClient(API_URL)
 
 def ask_chatbot(question):
     print(f"Asking: '{question}'...")
     
-    payload = {
-        "query": question,
-        "limit": 3
-    }
-    
     try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()
-        
-        data = response.json()
-        results = data.get("results", [])
+        results = client.search(question, limit=3)
         
         if not results:
             print("No results found.")
@@ -32,7 +26,7 @@ def ask_chatbot(question):
             # Print first 200 chars of content
             print(f"{res['content'][:200]}...\n")
             
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("Error: Could not connect to the API. Is the backend running?")
     except Exception as e:
         print(f"Error: {e}")
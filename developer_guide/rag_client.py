@@ -0,0 +1,346 @@
+"""Client library and load generator for the chatbot APIs.
+
+RAGClient (blocking) and AsyncRAGClient (asyncio) keep a pool of keep-alive
+connections, apply a timeout to every request, and retry connection
+errors, timeouts, 429 and 502-504 responses with jittered exponential
+backoff (honouring Retry-After). Create one client and reuse it; every
+call on it shares the pool.
+
+    from rag_client import RAGClient
+
+    with RAGClient("http://localhost:8000") as client:
+        results = client.search("How do humanoid robots balance?", limit=3)
+        batches = client.search_batch(["What is a PID controller?", "zero moment point"])
+
+Run as a script to ask one question, or to load-test /search or /api/chat
+at a fixed concurrency (closed loop) or a fixed request rate (open loop):
+
+    python rag_client.py ask "How do humanoid robots balance?"
+    python rag_client.py load --endpoint search --concurrency 16 --requests 2000
+    python rag_client.py load --endpoint chat --url http://localhost:8001 --rate 5 --duration 60
+
+Requires httpx (pip install httpx).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import httpx
+
+DEFAULT_URL = "http://localhost:8000"
+# Same limit as the API's RAG_MAX_BATCH_QUERIES default; larger batches are split
+MAX_BATCH_QUERIES = 256
+RETRY_STATUSES = {429, 502, 503, 504}
+QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../rag_chatbot/eval_queries.json")
+
+class APIError(Exception):
+    """Non-2xx response, after retries."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"HTTP {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+def _limits(max_connections):
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+def _backoff(attempt, response, base, cap=10.0):
+    """Seconds to wait before retry `attempt` (0-based): Retry-After if given, else full jitter."""
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _result(response):
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.text)
+        except ValueError:
+            detail = response.text
+        raise APIError(response.status_code, detail)
+    return response.json()
+
+def _batches(queries, limit):
+    items = [q if isinstance(q, dict) else {"query": q, "limit": limit} for q in queries]
+    return [items[i:i + MAX_BATCH_QUERIES] for i in range(0, len(items), MAX_BATCH_QUERIES)]
+
+class _EventParser:
+    """Server-sent events, one line at a time: feed() returns the answer text of a completed
+    `token` event, raises APIError for an `error` event, and otherwise returns None."""
+
+    def __init__(self):
+        self.event, self.data = "message", []
+
+    def feed(self, line):
+        if line.startswith("event:"):
+            self.event = line[6:].strip()
+        elif line.startswith("data:"):
+            self.data.append(line[5:].strip())
+        elif not line and self.data:
+            event, payload = self.event, json.loads("\n".join(self.data))
+            self.event, self.data = "message", []
+            if event == "error":
+                raise APIError(502, payload["error"])
+            if event == "token":
+                return payload["text"]
+        return None
+
+class RAGClient:
+    """Blocking client with a keep-alive connection pool."""
+
+    def __init__(self, base_url=DEFAULT_URL, timeout=10.0, retries=3, backoff=0.2, max_connections=20,
+                 chat_path="/api/chat"):
+        self.retries = retries
+        self.backoff = backoff
+        self.chat_path = chat_path
+        self.http = httpx.Client(base_url=base_url, timeout=timeout, limits=_limits(max_connections))
+
+    def request(self, method, path, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = self.http.request(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return _result(response)
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt == self.retries:
+                    raise
+            time.sleep(_backoff(attempt, response, self.backoff))
+
+    def search(self, query, limit=5, mode=None):
+        body = {"query": query, "limit": limit, **({"mode": mode} if mode else {})}
+        return self.request("POST", "/search", json=body)["results"]
+
+    def search_batch(self, queries, limit=5):
+        """One result list per query (strings or /search bodies), in order, via /search/batch."""
+        results = []
+        for batch in _batches(queries, limit):
+            results += [r["results"] for r in self.request("POST", "/search/batch", json={"queries": batch})["results"]]
+        return results
+
+    def chat(self, query, **fields):
+        return self.request("POST", self.chat_path, json={"query": query, **fields})
+
+    def stream_chat(self, query, path="/api/chat/stream", **fields):
+        """Yield answer text as it is generated (server-sent events); not retried once started."""
+        with self.http.stream("POST", path, json={"query": query, **fields}) as response:
+            if response.status_code >= 400:
+                response.read()
+                _result(response)
+            parser = _EventParser()
+            for line in response.iter_lines():
+                text = parser.feed(line)
+                if text is not None:
+                    yield text
+
+    def ready(self):
+        return self.http.get("/ready").status_code == 200
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class AsyncRAGClient:
+    """asyncio client with a keep-alive connection pool; `max_connections` also caps concurrency."""
+
+    def __init__(self, base_url=DEFAULT_URL, timeout=10.0, retries=3, backoff=0.2, max_connections=20,
+                 chat_path="/api/chat"):
+        self.retries = retries
+        self.backoff = backoff
+        self.chat_path = chat_path
+        self.max_connections = max_connections
+        self.http = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=_limits(max_connections))
+
+    async def request(self, method, path, **kwargs):
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                response = await self.http.request(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return _result(response)
+            except (httpx.TransportError, httpx.TimeoutException):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(_backoff(attempt, response, self.backoff))
+
+    async def search(self, query, limit=5, mode=None):
+        body = {"query": query, "limit": limit, **({"mode": mode} if mode else {})}
+        return (await self.request("POST", "/search", json=body))["results"]
+
+    async def search_batch(self, queries, limit=5):
+        """One result list per query via /search/batch; batches are sent concurrently."""
+        responses = await asyncio.gather(*[self.request("POST", "/search/batch", json={"queries": batch})
+                                           for batch in _batches(queries, limit)])
+        return [r["results"] for response in responses for r in response["results"]]
+
+    async def search_many(self, queries, limit=5, mode=None):
+        """Individual /search calls, run concurrently over the pool."""
+        return await asyncio.gather(*[self.search(q, limit, mode) for q in queries])
+
+    async def chat(self, query, **fields):
+        return await self.request("POST", self.chat_path, json={"query": query, **fields})
+
+    async def stream_chat(self, query, path="/api/chat/stream", **fields):
+        """Yield answer text as it is generated (server-sent events); not retried once started."""
+        async with self.http.stream("POST", path, json={"query": query, **fields}) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                _result(response)
+            parser = _EventParser()
+            async for line in response.aiter_lines():
+                text = parser.feed(line)
+                if text is not None:
+                    yield text
+
+    async def ready(self):
+        return (await self.http.get("/ready")).status_code == 200
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+def percentile_ms(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 2)
+
+def load_queries(path=QUERIES_PATH):
+    """Questions from a JSON list of strings or an eval_queries.json-style file."""
+    if not os.path.exists(path):
+        return ["How do humanoid robots balance?", "What is a PID controller?", "zero moment point",
+                "How does a DC motor work?", "gait cycle example in Python"]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data["queries"] if isinstance(data, dict) else data
+    return [item["query"] if isinstance(item, dict) else item for item in items]
+
+async def load_test(client, endpoint, queries, concurrency=None, requests=1000, rate=None, duration=30.0, limit=5):
+    """Drive one endpoint and report throughput and latency percentiles.
+
+    With `rate`, requests start on a fixed schedule for `duration` seconds
+    (open loop) and latency is measured from each request's scheduled start,
+    so a slow server cannot hide queueing delay. Otherwise `concurrency`
+    workers send `requests` requests back to back (closed loop).
+    """
+    async def one(i):
+        query = queries[i % len(queries)]
+        if endpoint == "search":
+            await client.search(query, limit=limit)
+        else:
+            await client.chat(query)
+
+    latencies, errors = [], {}
+
+    async def timed(i, scheduled):
+        try:
+            await one(i)
+            latencies.append(time.perf_counter() - scheduled)
+        except Exception as e:
+            key = str(e.status_code) if isinstance(e, APIError) else type(e).__name__
+            errors[key] = errors.get(key, 0) + 1
+
+    start = time.perf_counter()
+    if rate:
+        tasks = []
+        total = int(rate * duration)
+        for i in range(total):
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            tasks.append(asyncio.create_task(timed(i, scheduled)))
+        await asyncio.gather(*tasks)
+    else:
+        total = requests
+        counter = iter(range(requests))
+
+        async def worker():
+            for i in counter:
+                await timed(i, time.perf_counter())
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    return {
+        "endpoint": endpoint,
+        "mode": f"rate {rate}/s" if rate else f"concurrency {concurrency}",
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "max_ms": percentile_ms(latencies, 100),
+    }
+
+def ask(url, question):
+    """Print the top sections for one question, like example_client.py."""
+    with RAGClient(url) as client:
+        results = client.search(question, limit=3)
+    if not results:
+        print("No results found.")
+        return
+    print(f"\nFound {len(results)} relevant sections:\n")
+    for i, res in enumerate(results, 1):
+        print(f"--- Result {i}: {res['title']} (Score: {res['score']:.2f}) ---")
+        print(f"{res['content'][:200]}...\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Chatbot API client and load generator.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ask_parser = commands.add_parser("ask", help="Search the book for one question")
+    ask_parser.add_argument("question")
+    ask_parser.add_argument("--url", default=DEFAULT_URL)
+    load = commands.add_parser("load", help="Load-test /search or /api/chat")
+    load.add_argument("--url", default=DEFAULT_URL)
+    load.add_argument("--endpoint", choices=["search", "chat"], default="search")
+    load.add_argument("--chat-path", default="/api/chat")
+    load.add_argument("--concurrency", type=int, default=8, help="Closed loop: requests in flight")
+    load.add_argument("--requests", type=int, default=1000, help="Closed loop: total requests")
+    load.add_argument("--rate", type=float, help="Open loop: requests started per second")
+    load.add_argument("--duration", type=float, default=30.0, help="Open loop: seconds to run")
+    load.add_argument("--queries", default=QUERIES_PATH, help="JSON file of questions")
+    load.add_argument("--timeout", type=float, default=30.0)
+    load.add_argument("--retries", type=int, default=0, help="Retries per request (0 measures raw errors)")
+    load.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    if args.command == "ask":
+        ask(args.url, args.question)
+        return
+
+    async def run():
+        # Open loop needs enough connections for every request the server is still working on
+        connections = max(args.concurrency, int(args.rate * args.timeout) if args.rate else 0)
+        async with AsyncRAGClient(args.url, timeout=args.timeout, retries=args.retries,
+                                  max_connections=min(connections, 1000), chat_path=args.chat_path) as client:
+            return await load_test(client, args.endpoint, load_queries(args.queries), args.concurrency,
+                                   args.requests, args.rate, args.duration)
+
+    report = json.dumps(asyncio.run(run()), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except httpx.ConnectError:
+        sys.exit("Error: Could not connect to the API. Is the backend running?")
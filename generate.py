@@ -6,17 +6,150 @@ Spec-driven book generator + Gemini multi-model router
 
 import os
 import json
+import time
+import hashlib
+import random
+import argparse
+import threading
 import yaml
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import google.generativeai as genai
+from google.api_core import exceptions
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Errors worth retrying: rate limits, overload and timeouts
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    exceptions.ResourceExhausted,
+    exceptions.TooManyRequests,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+    exceptions.DeadlineExceeded,
+)
+
+MODEL_NAME = 'gemini-2.0-flash'
+CHAPTER_CONFIG = {'max_output_tokens': 2000, 'temperature': 0.8}
+# Generated chapter text, content-addressed: <key>.md per distinct (prompt, model, config, chapter spec)
+GENERATION_CACHE_DIR = Path(os.getenv('GEN_CACHE_DIR', '.generation_cache'))
+
+def generation_key(prompt, model_name, config, chapter):
+    """Hash of everything that determines a chapter's generated text"""
+    payload = json.dumps({'prompt': prompt, 'model': model_name, 'config': config, 'chapter': chapter},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class GenerationCache:
+    """Chapter texts stored by generation_key, plus manifest.json mapping chapter ids to keys"""
+    
+    def __init__(self, root=GENERATION_CACHE_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / 'manifest.json'
+        self.manifest = {'chapters': {}}
+        if self.manifest_path.exists():
+            self.manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+    
+    def get(self, key):
+        path = self.root / f'{key}.md'
+        return path.read_text(encoding='utf-8') if path.exists() else None
+    
+    def put(self, key, text):
+        path = self.root / f'{key}.md'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, path)
+    
+    def save_manifest(self, reports):
+        chapters = self.manifest.setdefault('chapters', {})
+        for r in reports:
+            if r['error'] is None:
+                previous = chapters.get(r['id'], {})
+                reused = r['cached'] and previous.get('key') == r['key']
+                generated = previous.get('generated_at') if reused else None
+                chapters[r['id']] = {
+                    'key': r['key'],
+                    'title': r['title'],
+                    'model': r['model'],
+                    'generated_at': generated or time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                }
+        tmp = self.manifest_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.manifest, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+        os.replace(tmp, self.manifest_path)
+
+def write_if_missing(path, text):
+    """Write a scaffold file unless it already exists; returns whether it was written."""
+    if path.exists():
+        return False
+    path.write_text(text, encoding='utf-8')
+    return True
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` calls per second on average, bursts up to `capacity`."""
+    
+    def __init__(self, rate, capacity):
+        # A zero rate never refills (and divides by zero); a negative one never recovers
+        if not rate > 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        if capacity < 1:
+            raise ValueError(f"Token bucket capacity must be at least 1, got {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then take it; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class FakeModel:
+    """Offline stand-in for Gemini (FAKE_LLM=1): canned chapters after FAKE_LLM_DELAY_MS,
+    with FAKE_LLM_FAILURE_RATE of calls failing transiently."""
+    
+    def __init__(self, delay=1.0, failure_rate=0.0):
+        self.delay = delay
+        self.failure_rate = failure_rate
+    
+    def generate_content(self, prompt, generation_config=None):
+        time.sleep(self.delay * random.uniform(0.5, 1.5))
+        if random.random() < self.failure_rate:
+            raise exceptions.ServiceUnavailable("Fake model is temporarily unavailable")
+        return type("Response", (), {"text": f"## Learning Objectives\n\nFake chapter for prompt: {prompt}\n"})()
+
 class HackathonProjectGenerator:
     """Complete end-to-end hackathon project generator"""
     
-    def __init__(self):
+    def __init__(self, workers=4, requests_per_minute=15, retries=3, force=None):
+        self.workers = workers
+        # Chapter ids to regenerate even when cached; an empty list means all of them
+        self.force = force
+        # Burst of up to `workers` calls, then requests_per_minute on average
+        self.rate_limiter = TokenBucket(requests_per_minute / 60, max(1, workers))
+        self.retries = retries
+        self.print_lock = threading.Lock()
+        
+        if os.getenv('FAKE_LLM', '0') == '1':
+            self.model = FakeModel(int(os.getenv('FAKE_LLM_DELAY_MS', '1000')) / 1000,
+                                   float(os.getenv('FAKE_LLM_FAILURE_RATE', '0')))
+            self.model_name = 'fake'
+            print("✅ Fake model initialized (FAKE_LLM=1)")
+            return
+        
         api_key = None
         api_key = os.getenv('GEMINI_API_KEY')
         
@@ -33,11 +166,15 @@ class HackathonProjectGenerator:
             raise ValueError("GEMINI_API_KEY not found")
         
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.model = genai.GenerativeModel(MODEL_NAME)
+        self.model_name = MODEL_NAME
         print(f"✅ Gemini initialized (key: {api_key[:10]}...)")
     
     def create_spec_yaml(self):
-        """Create spec.yaml"""
+        """Create spec.yaml unless it exists, so edits to it survive reruns"""
+        if Path('spec.yaml').exists():
+            print("✅ spec.yaml found")
+            return
         spec = """spec:
   project_name: "physical-ai-humanoid-robotics"
   description: "Complete course on humanoid robotics"
@@ -71,7 +208,9 @@ metadata:
         print("✅ spec.yaml created")
     
     def create_root_env(self):
-        """Create root .env file"""
+        """Create root .env file unless it exists"""
+        if Path('.env').exists():
+            return
         env = "GEMINI_API_KEY=your-api-key-here\n"
         Path('.env').write_text(env, encoding='utf-8')
         print("✅ .env created")
@@ -92,8 +231,7 @@ metadata:
         (book_dir / 'static').mkdir(exist_ok=True)
         
         chapters = spec['book']['chapters']
-        for ch in chapters:
-            self._generate_chapter(book_dir, ch)
+        self._generate_chapters(book_dir, chapters)
         
         self._create_docusaurus_config(book_dir, spec)
         self._create_sidebars(book_dir, chapters)
@@ -102,23 +240,86 @@ metadata:
         
         print(f"✅ Book created at: {book_dir}")
     
-    def _generate_chapter(self, book_dir, chapter):
-        """Generate single chapter using Gemini"""
+    def _log(self, message):
+        with self.print_lock:
+            print(message, flush=True)
+    
+    def _generate_chapters(self, book_dir, chapters):
+        """Generate chapters concurrently on `workers` threads and print a timing report"""
+        print(f"  {len(chapters)} chapters, {self.workers} workers, "
+              f"{self.rate_limiter.rate * 60:g} requests/min")
+        cache = GenerationCache()
+        start = time.perf_counter()
+        reports = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._generate_chapter, book_dir, ch, cache): ch for ch in chapters}
+            for done, future in enumerate(as_completed(futures), 1):
+                report = future.result()
+                reports.append(report)
+                mark = "✓" if report['error'] is None else "✗"
+                detail = "cached" if report['cached'] else f"{report['attempts']} attempt(s)"
+                self._log(f"  [{done}/{len(chapters)}] {mark} {report['id']} ({report['seconds']:.1f}s, {detail})")
+        wall = time.perf_counter() - start
+        cache.save_manifest(reports)
+        
+        order = {ch['id']: i for i, ch in enumerate(chapters)}
+        reports.sort(key=lambda r: order[r['id']])
+        width = max(len(r['id']) for r in reports) if reports else 7
+        print(f"\n  {'Chapter':<{width}}  {'Time':>7}  {'Waited':>7}  {'Attempts':>8}  Status")
+        for r in reports:
+            status = ("cached" if r['cached'] else "ok") if r['error'] is None else f"failed: {r['error']}"
+            print(f"  {r['id']:<{width}}  {r['seconds']:>6.1f}s  {r['waited']:>6.1f}s  {r['attempts']:>8}  {status}")
+        total = sum(r['seconds'] for r in reports)
+        cached = sum(1 for r in reports if r['cached'])
+        print(f"  {len(reports)} chapters in {wall:.1f}s wall ({total:.1f}s if sequential), "
+              f"{cached} from cache, {len(reports) - cached} generated\n")
+        
+        failed = [r['id'] for r in reports if r['error'] is not None]
+        if failed:
+            raise RuntimeError(f"Chapter generation failed for: {', '.join(failed)}")
+        return reports
+    
+    def _generate_content(self, prompt, generation_config, report):
+        """One model call under the rate limit, retrying transient errors with jittered backoff"""
+        for attempt in range(self.retries + 1):
+            report['waited'] += self.rate_limiter.acquire()
+            report['attempts'] += 1
+            try:
+                return self.model.generate_content(prompt, generation_config=generation_config)
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                delay = random.uniform(0, min(30.0, 2.0 * 2 ** attempt))
+                self._log(f"  ↻ {report['id']}: {type(e).__name__}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+    
+    def _generate_chapter(self, book_dir, chapter, cache):
+        """Generate single chapter using Gemini, or reuse its cached text; returns its timing report"""
         ch_id = chapter['id']
         ch_title = chapter['title']
         
         prompt = f"Write a markdown chapter for: {ch_title}. Include learning objectives, intro, 3-4 sections, code examples, and key takeaways. Use simple ASCII text only."
+        key = generation_key(prompt, self.model_name, CHAPTER_CONFIG, chapter)
         
-        print(f"  ⏳ Generating: {ch_id}...", end='', flush=True)
-        
-        resp = self.model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(max_output_tokens=2000, temperature=0.8)
-        )
-        
-        content = f"---\ntitle: {ch_title}\n---\n\n{resp.text}"
-        (book_dir / f'docs/{ch_id}.md').write_text(content, encoding='utf-8')
-        print(" ✓")
+        report = {'id': ch_id, 'title': ch_title, 'key': key, 'model': self.model_name, 'cached': False,
+                  'seconds': 0.0, 'waited': 0.0, 'attempts': 0, 'error': None}
+        start = time.perf_counter()
+        try:
+            forced = self.force is not None and (not self.force or ch_id in self.force)
+            text = None if forced else cache.get(key)
+            if text is not None:
+                report['cached'] = True
+            else:
+                self._log(f"  ⏳ Generating: {ch_id}...")
+                resp = self._generate_content(prompt, genai.types.GenerationConfig(**CHAPTER_CONFIG), report)
+                text = resp.text
+                cache.put(key, text)
+            content = f"---\ntitle: {ch_title}\n---\n\n{text}"
+            (book_dir / f'docs/{ch_id}.md').write_text(content, encoding='utf-8')
+        except Exception as e:
+            report['error'] = f"{type(e).__name__}: {e}"
+        report['seconds'] = time.perf_counter() - start
+        return report
     
     def _create_docusaurus_config(self, book_dir, spec):
         """Create docusaurus.config.js"""
@@ -192,7 +393,7 @@ code {background-color: #f1f5f9;padding: 2px 6px;border-radius: 3px;}
         (book_dir / 'src/css/custom.css').write_text(css, encoding='utf-8')
     
     def generate_fastapi_backend(self):
-        """Generate FastAPI backend with Gemini router"""
+        """Scaffold the FastAPI backend with Gemini router, keeping any files that exist"""
         print("\n🔧 Generating FastAPI backend...")
         
         with open('spec.yaml', encoding='utf-8') as f:
@@ -276,14 +477,19 @@ if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
 """
         
-        (backend_dir / 'main.py').write_text(main_py, encoding='utf-8')
-        (backend_dir / 'requirements.txt').write_text("fastapi==0.104.1\nuvicorn==0.24.0\npydantic==2.5.0\ngoogle-generativeai==0.3.0\npython-dotenv==1.0.0\npyyaml==6.0\n", encoding='utf-8')
-        (backend_dir / '.env').write_text("GEMINI_API_KEY=your-api-key-here\n", encoding='utf-8')
+        # Scaffold only: the backend is maintained by hand once it exists, so reruns keep it
+        files = {
+            'main.py': main_py,
+            'requirements.txt': "fastapi==0.104.1\nuvicorn==0.24.0\npydantic==2.5.0\ngoogle-generativeai==0.3.0\npython-dotenv==1.0.0\npyyaml==6.0\n",
+            '.env': "GEMINI_API_KEY=your-api-key-here\n",
+        }
+        created = [name for name, text in files.items() if write_if_missing(backend_dir / name, text)]
+        kept = [name for name in files if name not in created]
         
-        print(f"✅ Backend created at: {backend_dir}")
+        print(f"✅ Backend at: {backend_dir}" + (f" (kept existing {', '.join(kept)})" if kept else ""))
     
     def create_readme(self):
-        """Create README"""
+        """Create README unless it exists"""
         readme = """# Physical AI: Humanoid Robotics Course
 GIAIC Spec-Driven Hackathon Project
 
@@ -313,8 +519,10 @@ Visit: http://localhost:3000
 - backend/ - FastAPI server
 - spec.yaml - Configuration
 """
-        Path('README.md').write_text(readme, encoding='utf-8')
-        print("✅ README.md created")
+        if write_if_missing(Path('README.md'), readme):
+            print("✅ README.md created")
+        else:
+            print("✅ README.md found")
     
     def run(self):
         """Run complete setup"""
@@ -344,6 +552,23 @@ Visit: http://localhost:3000
             print(f"\nError: {e}")
             raise
 
+def positive_float(value):
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
 if __name__ == "__main__":
-    gen = HackathonProjectGenerator()
-    gen.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Spec-driven book generator + Gemini multi-model router")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GEN_WORKERS", "4")),
+                        help="Chapters generated concurrently")
+    # The default is a string so GEN_REQUESTS_PER_MINUTE is validated like --rpm
+    parser.add_argument("--rpm", type=positive_float, default=os.getenv("GEN_REQUESTS_PER_MINUTE", "15"),
+                        help="Gemini requests per minute (token bucket)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per chapter for transient errors")
+    parser.add_argument("--force", nargs="*", metavar="CHAPTER_ID",
+                        help="Regenerate these chapters even if cached (all chapters when no id is given)")
+    args = parser.parse_args()
+    gen = HackathonProjectGenerator(workers=args.workers, requests_per_minute=args.rpm, retries=args.retries,
+                                    force=args.force)
+    gen.run()
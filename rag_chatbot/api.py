@@ -1,19 +1,218 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 import uvicorn
 import os
+import gc
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from caches import LRUCache, ResponseCache, normalize_query
+from batching import MicroBatcher, Overloaded
+from vector_store import SNAPSHOT_PATH, VECTOR_BACKEND, Hit, open_snapshot, open_store, write_snapshot
+from lexical import LEXICAL_INDEX_PATH, LexicalIndex, reciprocal_rank_fusion
+from embeddings import EMBEDDING_ENGINE, load_encoder, set_torch_threads
+# Metrics are shared with the other services from the repository-level `shared` package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared.metrics import REGISTRY, instrument, span
 
 # Configuration
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-QDRANT_PATH = os.path.join(BASE_DIR, "qdrant_storage")
-COLLECTION_NAME = "physical_ai_book"
 MODEL_NAME = "all-MiniLM-L6-v2"
+# Re-index book/docs in-process as files are saved (embedded Qdrant is single-process)
+WATCH_DOCS = os.getenv("RAG_WATCH_DOCS", "0") == "1"
+# Query embedding cache: entries (0 disables) and seconds to live (0 = no expiry)
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+# Whole /search responses per (query, limit, mode, index version): entries (0 disables)
+# and an optional SQLite tier that survives restarts and is shared by workers
+RESPONSE_CACHE_SIZE = int(os.getenv("RAG_RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_DISK = os.getenv("RAG_RESPONSE_CACHE_DISK", "0") == "1"
+RESPONSE_CACHE_PATH = os.getenv("RAG_RESPONSE_CACHE_PATH", os.path.join(BASE_DIR, "response_cache.sqlite"))
+# Upper bound on results per query
+MAX_LIMIT = int(os.getenv("RAG_MAX_LIMIT", "50"))
+# Upper bound on queries accepted by a single /search/batch call
+MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "256"))
+# Micro-batching of concurrent /search encodes
+MICRO_BATCHING = os.getenv("RAG_MICRO_BATCHING", "1") == "1"
+MICRO_BATCH_SIZE = int(os.getenv("RAG_MICRO_BATCH_SIZE", "32"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("RAG_MICRO_BATCH_WAIT_MS", "5"))
+MICRO_BATCH_QUEUE = int(os.getenv("RAG_MICRO_BATCH_QUEUE", "256"))
+# "hybrid" fuses BM25 and vector rankings; "vector" is pure embedding search
+SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "hybrid")
+# Candidates taken from each ranking before fusion, and the RRF damping constant
+HYBRID_DEPTH = int(os.getenv("RAG_HYBRID_DEPTH", "50"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Worker processes; more than one serves a shared read-only snapshot of the index
+WORKERS = int(os.getenv("RAG_WORKERS", "1"))
+# Allow per-request sampling profiles via the X-Profile: 1 header (off by default)
+PROFILING = os.getenv("RAG_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("RAG_PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
 
-app = FastAPI(title="Physical AI RAG API")
+# Heavy resources are loaded by a background warm-up thread so the process
+# answers /health immediately; /ready flips only once the model is warm.
+store = None
+lexical = LexicalIndex()
+model = None
+batcher = None
+watcher = None
+class ReadWriteLock:
+    """Searches share the read side; the docs watcher's writes take the lock exclusively.
+
+    `with lock:` is the write side, so it can stand in for a threading.Lock.
+    Waiting writers block new readers, so a steady stream of searches cannot
+    starve a re-index.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def __enter__(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+# Lets searches run concurrently while the docs watcher's upserts exclude them
+index_lock = ReadWriteLock()
+startup = {"state": "starting", "error": None, "phases": {}}
+# Version stamp of the served index (from the indexer's manifest); None disables response caching
+index_version = None
+# Set when the index was opened in the parent before forking workers
+preloaded = False
+# Inference threads per process (0 = the engine's default); split between forked workers
+encoder_threads = 0
+
+def timed_phase(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    startup["phases"][name] = round(time.perf_counter() - start, 3)
+    print(f"Startup: {name} took {startup['phases'][name]:.3f}s")
+    return result
+
+def read_index_version(directory=BASE_DIR):
+    try:
+        with open(os.path.join(directory, "index_manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+def refresh_index_version(directory=BASE_DIR):
+    """Adopt the manifest's version, dropping cached responses from older versions."""
+    global index_version
+    version = read_index_version(directory)
+    if version != index_version:
+        index_version = version
+        if response_cache:
+            response_cache.invalidate(version)
+
+def load_index(snapshot=False):
+    """Open the vector store and BM25 index (the read-only snapshot with `snapshot`)."""
+    global store, lexical
+    refresh_index_version(SNAPSHOT_PATH if snapshot else BASE_DIR)
+    if snapshot:
+        store = timed_phase("vector_store", open_snapshot)
+        lexical = timed_phase("lexical_index", lambda: LexicalIndex.load_or_empty(
+            os.path.join(SNAPSHOT_PATH, os.path.basename(LEXICAL_INDEX_PATH))))
+    else:
+        store = timed_phase("vector_store", lambda: open_store(VECTOR_BACKEND))
+        lexical = timed_phase("lexical_index", LexicalIndex.load_or_empty)
+
+def load_model(threads=0):
+    """Load the encoder without running it."""
+    global model
+    model = timed_phase("model", lambda: load_encoder(EMBEDDING_ENGINE, MODEL_NAME, threads=threads))
+
+def warm_model():
+    """Run a dummy encode: the first one allocates buffers and picks kernels; pay for it here, not on a request."""
+    timed_phase("warm_encode", lambda: model.encode(["warm up"], batch_size=1))
+
+def start_services():
+    """Per-process threads; these do not survive a fork, so each worker starts its own."""
+    global batcher, watcher
+    if MICRO_BATCHING:
+        # Concurrent /search requests share one encode instead of fighting over cores
+        batcher = MicroBatcher(encode_batch, max_batch_size=MICRO_BATCH_SIZE,
+                               max_wait=MICRO_BATCH_WAIT_MS / 1000, max_queue=MICRO_BATCH_QUEUE)
+    if WATCH_DOCS and not preloaded:
+        import indexer
+        watcher = timed_phase("docs_watcher", lambda: indexer.DocsWatcher(
+            store, lambda: model, lock=index_lock, lexical=lexical,
+            on_change=lambda summary: refresh_index_version()).start())
+
+def warm_up():
+    """Open the index and load the model (unless the parent already did), warm it and start this process's services."""
+    print("Loading resources...")
+    try:
+        if not preloaded:
+            load_index()
+        if model is None:
+            load_model(threads=encoder_threads)
+        else:
+            # Weights inherited from the parent, which loaded them single-threaded
+            set_torch_threads(encoder_threads)
+        warm_model()
+        start_services()
+    except Exception as e:
+        print(f"Error loading resources: {e}")
+        startup["error"] = str(e)
+        startup["state"] = "failed"
+        return
+    startup["phases"]["total"] = round(sum(startup["phases"].values()), 3)
+    startup["state"] = "ready"
+    source = "read-only snapshot" if preloaded else f"{VECTOR_BACKEND} vector store"
+    print(f"Resources loaded in {startup['phases']['total']:.3f}s ({source}, {EMBEDDING_ENGINE} embeddings).")
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    if watcher:
+        watcher.stop()
+
+def require_ready():
+    if startup["state"] == "failed":
+        raise HTTPException(status_code=500, detail="Search engine not initialized")
+    if startup["state"] != "ready":
+        raise HTTPException(status_code=503, detail="Search engine is warming up",
+                            headers={"Retry-After": "1"})
+
+app = FastAPI(title="Physical AI RAG API", lifespan=lifespan)
 
 # Enable CORS for all origins to allow external access
 app.add_middleware(
@@ -24,20 +223,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load resources globally (eager load for faster first request)
-print("Loading resources...")
-try:
-    client = QdrantClient(path=QDRANT_PATH)
-    model = SentenceTransformer(MODEL_NAME)
-    print("Resources loaded successfully.")
-except Exception as e:
-    print(f"Error loading resources: {e}")
-    client = None
-    model = None
+instrument(app, enable_profiling=PROFILING, profile_dir=PROFILE_DIR)
+
+query_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL or None)
+response_cache = None
+if RESPONSE_CACHE_SIZE > 0:
+    response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_PATH if RESPONSE_CACHE_DISK else None)
+
+def batcher_stat(name):
+    return lambda: batcher.stats()[name] if batcher else 0
+
+REGISTRY.gauge("rag_ready", "1 once the index is open and the model is warm",
+               fn=lambda: startup["state"] == "ready")
+REGISTRY.counter("rag_response_cache_hits_total", "Whole /search responses served from cache",
+                 fn=lambda: response_cache.stats()["hits"] + response_cache.disk_hits if response_cache else 0)
+REGISTRY.counter("rag_query_cache_hits_total", "Query embedding cache hits", fn=lambda: query_cache.stats()["hits"])
+REGISTRY.counter("rag_query_cache_misses_total", "Query embedding cache misses",
+                 fn=lambda: query_cache.stats()["misses"])
+REGISTRY.gauge("rag_query_cache_hit_rate", "Query embedding cache hit rate since start",
+               fn=lambda: query_cache.stats()["hit_rate"])
+REGISTRY.gauge("rag_micro_batch_queue_depth", "Queries waiting for the micro-batcher",
+               fn=batcher_stat("queue_depth"))
+REGISTRY.counter("rag_micro_batches_total", "Encode batches run by the micro-batcher", fn=batcher_stat("batches"))
+REGISTRY.counter("rag_micro_batch_items_total", "Queries encoded by the micro-batcher", fn=batcher_stat("items"))
+REGISTRY.counter("rag_micro_batch_rejected_total", "Queries shed with 503 because the queue was full",
+                 fn=batcher_stat("rejected"))
+
+def encode_batch(texts):
+    # Runs on the micro-batcher thread for /search; "embed" minus "encode" is queueing
+    with span("encode"):
+        return [vector.tolist() for vector in model.encode(texts, batch_size=len(texts))]
+
+def embed_queries(queries):
+    """Embed many queries in one forward pass, skipping recently seen (normalized) ones."""
+    keys = [normalize_query(q) for q in queries]
+    vectors = {}
+    missing = []
+    for key in keys:
+        if key in vectors:
+            continue
+        vector = query_cache.get(key)
+        if vector is None:
+            missing.append(key)
+            vectors[key] = None
+        else:
+            vectors[key] = vector
+    if missing:
+        encoded = encode_batch(missing)
+        for key, vector in zip(missing, encoded):
+            vectors[key] = vector
+            query_cache.set(key, vector)
+    return [vectors[key] for key in keys]
+
+async def embed_query(query):
+    """Embed one /search query, sharing a forward pass with other in-flight requests.
+
+    Waiting on the micro-batcher holds no threadpool thread, so under load
+    requests pile up in its bounded queue, which raises Overloaded when full.
+    """
+    key = normalize_query(query)
+    vector = query_cache.get(key)
+    if vector is None:
+        if batcher:
+            vector = await asyncio.wrap_future(batcher.submit(key))
+        else:
+            vector = (await run_in_threadpool(encode_batch, [key]))[0]
+        query_cache.set(key, vector)
+    return vector
 
 class SearchRequest(BaseModel):
     query: str
-    limit: int = 5
+    # Bounded so hybrid fusion never hands back the whole candidate pool
+    limit: int = Field(5, ge=1, le=MAX_LIMIT)
+    mode: Optional[Literal["vector", "hybrid"]] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchRequest]
 
 class SearchResult(BaseModel):
     filename: str
@@ -45,44 +306,212 @@ class SearchResult(BaseModel):
     score: float
     title: str = "Unknown"
 
+def use_hybrid(request):
+    return (request.mode or SEARCH_MODE) == "hybrid" and len(lexical) > 0
+
+def candidate_limit(request):
+    return max(request.limit, HYBRID_DEPTH) if use_hybrid(request) else request.limit
+
+def fuse(query, vector_hits, limit):
+    """Reciprocal-rank fusion of vector hits with BM25 hits for the same query.
+
+    Scores in the result are RRF scores, not cosine similarities.
+    """
+    lexical_ids = [point_id for point_id, _ in lexical.search(query, HYBRID_DEPTH)]
+    fused = reciprocal_rank_fusion([[hit.id for hit in vector_hits], lexical_ids], k=RRF_K)[:limit]
+    by_id = {hit.id: hit for hit in vector_hits}
+    missing = [point_id for point_id, _ in fused if point_id not in by_id]
+    if missing:
+        by_id.update((hit.id, hit) for hit in store.retrieve(missing))
+    return [Hit(point_id, score, by_id[point_id].payload) for point_id, score in fused if point_id in by_id]
+
+def to_results(hits):
+    output = []
+    for hit in hits or []:
+        # Extract clean title from filename or metadata if available
+        filename = hit.payload.get('filename', 'Unknown')
+        # Try to make a nicer title from the filename
+        title = filename.replace('.md', '').replace('-', ' ').title()
+
+        output.append(SearchResult(
+            filename=filename,
+            title=title,
+            content=hit.payload.get('content', ''),
+            score=hit.score
+        ))
+    return output
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    """Liveness: the process is up; fails only if warm-up failed."""
+    if startup["state"] == "failed":
+        return JSONResponse(status_code=500, content={"status": "error", "error": startup["error"]})
+    return {"status": "ok", "state": startup["state"]}
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 only once the index is open and the model is warm."""
+    body = {"status": startup["state"], "startup_seconds": startup["phases"]}
+    if startup["state"] != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"query_cache": query_cache.stats(),
+            "response_cache": {**response_cache.stats(), "index_version": index_version} if response_cache else None}
+
+@app.get("/batching/stats")
+def batching_stats():
+    return {"micro_batcher": batcher.stats() if batcher else None}
+
+def retrieve(request, vector, key):
+    """Blocking half of /search: store query, fusion and serialization, run in the threadpool."""
+    with index_lock.read():
+        with span("vector_search"):
+            hits = store.search(vector, candidate_limit(request))
+        if use_hybrid(request):
+            with span("fuse"):
+                hits = fuse(request.query, hits, request.limit)
+
+    with span("serialize"):
+        body = json.dumps(jsonable_encoder({"results": to_results(hits)})).encode("utf-8")
+    if key:
+        response_cache.set(key, body)
+    return body
 
 @app.post("/search")
-def search(request: SearchRequest):
-    if not client or not model:
-        raise HTTPException(status_code=500, detail="Search engine not initialized")
+async def search(request: SearchRequest):
+    require_ready()
     
+    # Identical requests against the same index version get identical bytes back
+    version = index_version
+    key = None
+    if response_cache and version:
+        key = (version, normalize_query(request.query), request.limit, request.mode or SEARCH_MODE)
+        with span("response_cache"):
+            body = response_cache.get(key)
+        if body is not None:
+            return Response(body, media_type="application/json", headers={"X-Cache": "hit"})
+
     try:
-        vector = model.encode(request.query).tolist()
-        
-        results = client.query_points(
-            collection_name=COLLECTION_NAME,
-            query=vector,
-            limit=request.limit
-        )
-        
-        output = []
-        if results and results.points:
-            for hit in results.points:
-                # Extract clean title from filename or metadata if available
-                filename = hit.payload.get('filename', 'Unknown')
-                # Try to make a nicer title from the filename
-                title = filename.replace('.md', '').replace('-', ' ').title()
-                
-                output.append(SearchResult(
-                    filename=filename,
-                    title=title,
-                    content=hit.payload.get('content', ''),
-                    score=hit.score
-                ))
-        
-        return {"results": output}
+        with span("embed"):
+            vector = await embed_query(request.query)
+        body = await run_in_threadpool(retrieve, request, vector, key)
+        return Response(body, media_type="application/json", headers={"X-Cache": "miss"})
         
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    require_ready()
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if not request.queries:
+        return {"results": []}
+
+    try:
+        with span("embed"):
+            vectors = embed_queries([q.query for q in request.queries])
+
+        with index_lock.read():
+            with span("vector_search"):
+                batches = store.search_batch(vectors, [candidate_limit(q) for q in request.queries])
+            with span("fuse"):
+                batches = [
+                    fuse(q.query, hits, q.limit) if use_hybrid(q) else hits
+                    for q, hits in zip(request.queries, batches)
+                ]
+
+        with span("serialize"):
+            return {"results": [{"results": to_results(hits)} for hits in batches]}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def build_snapshot():
+    """Copy the live index (and BM25 index) into SNAPSHOT_PATH."""
+    live = open_store(VECTOR_BACKEND)
+    try:
+        extra = [path for path in (LEXICAL_INDEX_PATH, os.path.join(BASE_DIR, "index_manifest.json"))
+                 if os.path.exists(path)]
+        count = write_snapshot(live, extra_files=extra)
+    finally:
+        live.close()
+    print(f"Wrote index snapshot with {count} points to {SNAPSHOT_PATH}")
+
+def serve_workers(host, port, workers, refresh_snapshot=False):
+    """Pre-fork server: open the snapshot and load the model once, then fork `workers` processes.
+
+    The snapshot is memory-mapped read-only and the torch weights are loaded
+    before fork, so workers share their pages instead of each holding a copy.
+    The parent loads the weights with one thread and never encodes: torch
+    starts its OpenMP thread pool on the first multi-threaded encode, and a
+    pool inherited across fork deadlocks the child's first encode. Each
+    worker sets its own thread count and runs the warm-up encode after fork.
+    ONNX Runtime creates its thread pool with the session, so those engines
+    still load per worker. All workers accept connections from one inherited
+    listening socket.
+    """
+    global preloaded, encoder_threads
+    if refresh_snapshot or not os.path.exists(os.path.join(SNAPSHOT_PATH, "vectors.npy")):
+        timed_phase("snapshot", build_snapshot)
+    if WATCH_DOCS:
+        print("RAG_WATCH_DOCS is ignored with several workers; the snapshot is immutable. "
+              "Re-run indexer.py --snapshot and restart to serve edits.")
+    load_index(snapshot=True)
+    preloaded = True
+    if EMBEDDING_ENGINE == "torch":
+        load_model(threads=1)
+    # Split the cores between workers so their encodes do not oversubscribe the CPU
+    encoder_threads = max(1, (os.cpu_count() or 1) // workers)
+    # Keep preloaded objects out of future collections so their pages stay shared
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            uvicorn.Server(uvicorn.Config(app, host=host, port=port)).run(sockets=[sock])
+            os._exit(0)
+        children.append(pid)
+    print(f"Serving on {host}:{port} with {workers} workers")
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the RAG search API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Worker processes; >1 serves a shared read-only index snapshot")
+    parser.add_argument("--refresh-snapshot", action="store_true",
+                        help="Rebuild the index snapshot from the live index before serving")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    # Host 0.0.0.0 allows access from other machines on the network
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    args = parse_args()
+    if args.workers > 1:
+        serve_workers(args.host, args.port, args.workers, args.refresh_snapshot)
+    else:
+        # Host 0.0.0.0 allows access from other machines on the network
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,91 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+class Overloaded(Exception):
+    """Raised when the batcher's queue is full and a request is shed."""
+
+class MicroBatcher:
+    """Coalesce concurrent single-item calls into batched calls.
+
+    Items submitted from many threads wait up to `max_wait` seconds (or until
+    `max_batch_size` items are queued) and are then passed together to
+    `batch_fn`, which must return one result per item in order. The queue is
+    bounded; once it holds `max_queue` items, submit() raises Overloaded.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait=0.005, max_queue=256):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise Overloaded("Too many queued requests")
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                self._run_batch()
+            except Exception as e:
+                # Whatever goes wrong with one batch must not end the only worker thread
+                print(f"Micro-batcher error: {e}")
+
+    def _run_batch(self):
+        # Callers that gave up (e.g. a disconnected client) have cancelled their future;
+        # skip those, and mark the rest running so they can no longer be cancelled
+        batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"batch_fn returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
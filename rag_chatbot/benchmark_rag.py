@@ -0,0 +1,248 @@
+"""Benchmark and evaluate the whole retrieval stack against book/docs.
+
+Optionally (re)builds the local index and times it, starts the API
+in-process on a free localhost port, scores /search against the versioned
+query set in eval_queries.json (recall@k and MRR per search mode), then
+load-tests /search at several concurrency levels. Everything runs offline
+against the local index; results are printed as JSON so runs can be
+diffed or compared with --compare.
+
+    python benchmark_rag.py --output results.json
+    python benchmark_rag.py --index --rebuild --cold-cache --concurrency 1 4 16
+    python benchmark_rag.py --url http://localhost:8000 --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import argparse
+import platform
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+# Never reach for the network: models must already be in the local cache
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+# Repeated benchmark queries would otherwise be answered from the caches
+os.environ.setdefault("RAG_QUERY_CACHE_SIZE", "0")
+os.environ.setdefault("RAG_RESPONSE_CACHE_SIZE", "0")
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERIES_PATH = os.path.join(BASE_DIR, "eval_queries.json")
+K_VALUES = (1, 3, 5, 10)
+
+def percentile_ms(samples, p):
+    return round(float(np.percentile(samples, p)) * 1000, 3) if samples else None
+
+def load_queries(path=QUERIES_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class Client:
+    """Keep-alive HTTP client, one connection per thread."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.local = threading.local()
+
+    def post(self, path, body):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+        return response.status, data
+
+    def get(self, path):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+def start_local_api():
+    """Run api.app with uvicorn on a free port in this process; returns its URL."""
+    import uvicorn
+    import api
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(api.app, log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+def wait_ready(client, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, body = client.get("/ready")
+            if status == 200:
+                return json.loads(body)
+            if json.loads(body).get("status") == "failed":
+                break
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API did not become ready")
+
+def build_index(rebuild, cold_cache):
+    """Time index_book on the local index; cold_cache ignores cached embeddings."""
+    import indexer
+    from vector_store import open_store
+
+    cache_dir = tempfile.mkdtemp() if cold_cache else None
+    cache_path = os.path.join(cache_dir, "cache.sqlite") if cold_cache else indexer.EMBEDDING_CACHE_PATH
+    # Closed again before the API opens it; embedded Qdrant allows one client per path
+    store = open_store(indexer.VECTOR_BACKEND)
+    try:
+        start = time.perf_counter()
+        summary = indexer.index_book(rebuild=rebuild, store=store, cache_path=cache_path)
+        seconds = time.perf_counter() - start
+    finally:
+        store.close()
+    return {"seconds": round(seconds, 3), "rebuild": rebuild, "cold_cache": cold_cache,
+            "chunks_per_second": round(summary["chunks"] / seconds, 1) if seconds else None, **summary}
+
+def evaluate(client, query_set, mode):
+    """recall@k (share of expected chapters in the top k) and MRR of the first expected chapter."""
+    limit = max(K_VALUES)
+    recall = {k: [] for k in K_VALUES}
+    reciprocal_ranks = []
+    misses = []
+    for item in query_set["queries"]:
+        status, body = client.post("/search", {"query": item["query"], "limit": limit, "mode": mode})
+        if status != 200:
+            raise RuntimeError(f"/search returned {status}: {body[:200]!r}")
+        # Chunks of the same chapter count once, at their best rank
+        chapters = []
+        for result in json.loads(body)["results"]:
+            if result["filename"] not in chapters:
+                chapters.append(result["filename"])
+        expected = set(item["expected"])
+        for k in K_VALUES:
+            recall[k].append(len(expected & set(chapters[:k])) / len(expected))
+        rank = next((i + 1 for i, name in enumerate(chapters) if name in expected), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        if rank != 1:
+            misses.append({"query": item["query"], "expected": item["expected"], "got": chapters[:3]})
+    metrics = {f"recall@{k}": round(float(np.mean(v)), 4) for k, v in recall.items()}
+    metrics["mrr"] = round(float(np.mean(reciprocal_ranks)), 4)
+    metrics["not_first"] = misses
+    return metrics
+
+def load_test(client, queries, concurrency, requests, limit=5):
+    """Latency percentiles and throughput of /search with `concurrency` clients in flight."""
+    def one(i):
+        start = time.perf_counter()
+        try:
+            status, _ = client.post("/search", {"query": queries[i % len(queries)], "limit": limit})
+        except OSError:
+            status = None
+        return status, time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(concurrency)))  # open connections, warm up
+        start = time.perf_counter()
+        outcomes = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - start
+    latencies = [seconds for status, seconds in outcomes if status == 200]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for status, _ in outcomes if status != 200),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "throughput_rps": round(len(latencies) / wall, 1),
+    }
+
+def run_config():
+    from embeddings import EMBEDDING_ENGINE, MODEL_NAME
+    from vector_store import QUANTIZATION, VECTOR_BACKEND
+    return {
+        "model": MODEL_NAME,
+        "engine": EMBEDDING_ENGINE,
+        "backend": VECTOR_BACKEND,
+        "quantization": QUANTIZATION,
+        "search_mode": os.getenv("RAG_SEARCH_MODE", "hybrid"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare(current, baseline):
+    """Print the change of every headline number from a previous run."""
+    def rows(result):
+        for mode, metrics in result.get("quality", {}).items():
+            for name, value in metrics.items():
+                if isinstance(value, (int, float)):
+                    yield f"quality.{mode}.{name}", value
+        for level in result.get("latency", []):
+            for name in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+                yield f"latency.c{level['concurrency']}.{name}", level[name]
+        if result.get("index"):
+            yield "index.seconds", result["index"]["seconds"]
+
+    before = dict(rows(baseline))
+    for name, value in rows(current):
+        if name in before and value is not None and before[name] is not None:
+            print(f"{name:>32}: {before[name]:>10} -> {value:<10} ({value - before[name]:+.4g})", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", default=QUERIES_PATH, help="Versioned query set (JSON)")
+    parser.add_argument("--url", help="Benchmark a running API instead of starting one in-process")
+    parser.add_argument("--index", action="store_true", help="Bring the local index up to date first and time it")
+    parser.add_argument("--rebuild", action="store_true", help="With --index, rebuild from scratch")
+    parser.add_argument("--cold-cache", action="store_true",
+                        help="With --index, embed every chunk instead of using the embedding cache")
+    parser.add_argument("--modes", nargs="+", default=["vector", "hybrid"], choices=["vector", "hybrid"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--output", help="Also write the JSON results here")
+    parser.add_argument("--compare", help="Previous results JSON to diff against")
+    args = parser.parse_args()
+
+    query_set = load_queries(args.queries)
+    result = {"query_set": {"path": os.path.basename(args.queries), "version": query_set["version"],
+                            "queries": len(query_set["queries"])},
+              "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+    if not args.url:
+        result["config"] = run_config()
+    if args.index:
+        if args.url:
+            parser.error("--index needs the in-process API (the index is opened by one process)")
+        result["index"] = build_index(args.rebuild, args.cold_cache)
+
+    client = Client(args.url or start_local_api())
+    result["startup"] = wait_ready(client).get("startup_seconds")
+    result["quality"] = {mode: evaluate(client, query_set, mode) for mode in args.modes}
+    queries = [item["query"] for item in query_set["queries"]]
+    result["latency"] = [load_test(client, queries, c, args.requests) for c in args.concurrency]
+
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+if __name__ == "__main__":
+    main()
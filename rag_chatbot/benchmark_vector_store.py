@@ -0,0 +1,101 @@
+"""Compare vector backends and quantization modes.
+
+Builds each store from the same unit vectors in a temp directory and
+reports open time, single-query and batch latency, resident first-pass
+memory, and recall@k against the exact brute-force answer. Runs fully
+offline; no model needed. Vectors are synthetic and clustered like real
+topical embeddings, or loaded from an existing store with --vectors.
+
+    python benchmark_vector_store.py --points 20000 --queries 500
+    python benchmark_vector_store.py --vectors vector_store/vectors.npy
+"""
+import time
+import uuid
+import tempfile
+import argparse
+import numpy as np
+from vector_store import VECTOR_SIZE, NumpyStore, QdrantStore
+
+def percentile(samples, p):
+    return float(np.percentile(samples, p)) * 1000
+
+def unit(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def synthetic(points, queries, clusters, rng):
+    centers = rng.standard_normal((clusters, VECTOR_SIZE))
+    data = centers[rng.integers(clusters, size=points)] + 0.6 * rng.standard_normal((points, VECTOR_SIZE))
+    return unit(data)
+
+def build(store, vectors, batch_size=1000):
+    ids = [str(uuid.UUID(int=i)) for i in range(len(vectors))]
+    store.reset()
+    for start in range(0, len(vectors), batch_size):
+        rows = range(start, min(start + batch_size, len(vectors)))
+        store.upsert([(ids[i], vectors[i], {"row": i}) for i in rows])
+    store.flush()
+
+def run(name, make_store, vectors, queries, limit):
+    store = make_store()
+    build(store, vectors)
+    store.close()
+
+    start = time.perf_counter()
+    store = make_store()
+    open_ms = (time.perf_counter() - start) * 1000
+
+    store.search(queries[0], limit)  # warm-up
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search(query, limit)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit.payload["row"] for hit in hits])
+
+    start = time.perf_counter()
+    store.search_batch(list(queries), [limit] * len(queries))
+    batch_ms = (time.perf_counter() - start) * 1000
+    resident = getattr(store, "resident_bytes", lambda: None)()
+    store.close()
+
+    memory = f"{resident / 2**20:7.2f} MB" if resident is not None else "      n/a"
+    print(f"{name:>13}: open {open_ms:8.1f} ms | query p50 {percentile(latencies, 50):7.3f} ms "
+          f"p95 {percentile(latencies, 95):7.3f} ms | batch of {len(queries)} {batch_ms:8.1f} ms | resident {memory}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--oversampling", type=float, default=None,
+                        help="Candidates rescored per result in quantized modes (default per mode)")
+    parser.add_argument("--vectors", help="Benchmark these .npy vectors instead of synthetic ones")
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.vectors:
+        vectors = unit(np.load(args.vectors))
+    else:
+        vectors = synthetic(args.points, args.queries, args.clusters, rng)
+    # Queries are perturbed copies of stored vectors, like paraphrased questions
+    picks = rng.integers(len(vectors), size=args.queries)
+    queries = unit(vectors[picks] + 0.05 * rng.standard_normal((args.queries, vectors.shape[1])))
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.limit]
+
+    print(f"{len(vectors)} points x {vectors.shape[1]} dims, {args.queries} queries, top-{args.limit}")
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [] if args.skip_qdrant else [("qdrant", lambda: QdrantStore(path=f"{tmp}/qdrant", quantization="none"))]
+        for quantization in ("none", "int8", "binary"):
+            variants.append((f"numpy-{quantization}", lambda q=quantization: NumpyStore(
+                path=f"{tmp}/numpy-{q}", quantization=q, oversampling=args.oversampling)))
+        for name, make_store in variants:
+            results = run(name, make_store, vectors, queries, args.limit)
+            recall = np.mean([len(set(r) & set(e)) / args.limit for r, e in zip(results, exact)])
+            print(f"{'':>13}  recall@{args.limit} vs exact: {recall:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+def normalize_query(query):
+    """Canonical cache key for a query.
+
+    all-MiniLM-L6-v2 is uncased and its tokenizer ignores runs of whitespace,
+    so case and spacing differences never change the embedding.
+    """
+    return " ".join(query.lower().split())
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional TTL and hit/miss/eviction counters.
+
+    A maxsize of 0 disables caching; a ttl of None keeps entries until evicted.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class ResponseCache:
+    """Serialized responses keyed by index version, with an optional SQLite tier.
+
+    Keys start with the index version they were computed against, so a
+    response can never outlive the index that produced it; invalidate()
+    drops the memory tier and older rows on disk once a new version is
+    live. The disk tier survives restarts and is shared between workers.
+
+    Each process opens its own SQLite connection on first use: a connection
+    carried across fork() into pre-forked workers can corrupt the database.
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.path = path
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    @property
+    def conn(self):
+        """This process's connection to the disk tier, or None without one."""
+        if not self.path:
+            return None
+        if self._conn_pid != os.getpid():
+            with self._lock:
+                # A connection opened in another process (before a fork) is never touched here
+                if self._conn_pid != os.getpid():
+                    conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+                    conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, version TEXT, body BLOB)")
+                    self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        body = self.memory.get(key)
+        if body is None and self.conn:
+            with self._lock:
+                row = self.conn.execute("SELECT body FROM responses WHERE key = ?", (json.dumps(key),)).fetchone()
+            if row:
+                body = bytes(row[0])
+                self.disk_hits += 1
+                self.memory.set(key, body)
+        return body
+
+    def set(self, key, body):
+        self.memory.set(key, body)
+        if self.conn:
+            with self._lock:
+                self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                                  (json.dumps(key), str(key[0]), body))
+                self.conn.commit()
+
+    def invalidate(self, version):
+        """Forget every response not computed against `version`."""
+        self.memory.clear()
+        if self.conn:
+            with self._lock:
+                self.conn.execute("DELETE FROM responses WHERE version != ?", (str(version),))
+                self.conn.commit()
+
+    def stats(self):
+        return {**self.memory.stats(), "disk": self.path, "disk_hits": self.disk_hits}
@@ -0,0 +1,168 @@
+import re
+import json
+
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+HEADING_RE = re.compile(r"^#{1,6}\s")
+
+def hub_repo(model_name):
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+def split_blocks(text):
+    """Split markdown into (block, starts_section) pairs.
+
+    Blocks are paragraphs, headings and whole fenced code blocks; a heading
+    starts a new section. Code fences are never split at their blank lines.
+    """
+    blocks = []
+    current = []
+    fence = None
+
+    def flush():
+        if current:
+            blocks.append(("\n".join(current).strip("\n"), False))
+            current.clear()
+
+    for line in text.splitlines():
+        if fence:
+            current.append(line)
+            # A closing fence carries no info string (```python opens, ``` closes)
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+                flush()
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            flush()
+            fence = match.group(1)
+            current.append(line)
+        elif HEADING_RE.match(line):
+            flush()
+            blocks.append((line.strip(), True))
+        elif not line.strip():
+            flush()
+        else:
+            current.append(line)
+    flush()
+    return blocks
+
+class TokenChunker:
+    """Pack markdown into chunks that fit the embedding model exactly.
+
+    Chunks hold at most `max_tokens` word-piece tokens (the model's
+    max_seq_length minus its special tokens by default), so nothing is
+    truncated at embedding time. Chunks never span two headings and never
+    cut a code fence unless the fence alone is over budget. Consecutive
+    chunks in a section share about `overlap` tokens, aligned to words.
+    """
+
+    def __init__(self, tokenizer, max_tokens, overlap=0):
+        if overlap >= max_tokens:
+            raise ValueError("overlap must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    @classmethod
+    def for_model(cls, model_name, max_tokens=0, overlap=0):
+        """Chunker using the model's own tokenizer; max_tokens=0 means the full sequence length."""
+        from transformers import AutoTokenizer
+        from huggingface_hub import hf_hub_download
+
+        repo = hub_repo(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(repo)
+        if not max_tokens:
+            with open(hf_hub_download(repo, "sentence_bert_config.json"), encoding="utf-8") as f:
+                max_seq_length = json.load(f)["max_seq_length"]
+            max_tokens = max_seq_length - tokenizer.num_special_tokens_to_add()
+        return cls(tokenizer, max_tokens, overlap)
+
+    def _encode(self, text):
+        return self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+
+    def count(self, texts):
+        if not texts:
+            return []
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def _word_start(self, word_ids, index, floor):
+        """Move a token index back to the first token of its word, but not below floor."""
+        while index > floor and word_ids[index] is not None and word_ids[index - 1] == word_ids[index]:
+            index -= 1
+        return index
+
+    def windows(self, text):
+        """Split an over-budget block into word-aligned, overlapping token windows."""
+        enc = self._encode(text)
+        offsets, word_ids = enc["offset_mapping"], enc.word_ids()
+        n = len(offsets)
+        out = []
+        start = 0
+        while start < n:
+            end = min(start + self.max_tokens, n)
+            if end < n:
+                end = self._word_start(word_ids, end, start + 1)
+            out.append(text[offsets[start][0]:offsets[end - 1][1]])
+            if end >= n:
+                break
+            start = max(self._word_start(word_ids, end - self.overlap, start + 1), start + 1)
+        return out
+
+    def tail(self, text):
+        """The last `overlap` tokens of text, starting on a word boundary."""
+        if not self.overlap:
+            return None
+        enc = self._encode(text)
+        offsets, word_ids = enc["offset_mapping"], enc.word_ids()
+        if len(offsets) <= self.overlap:
+            return None
+        start = len(offsets) - self.overlap
+        while start < len(offsets) and word_ids[start] is not None and word_ids[start - 1] == word_ids[start]:
+            start += 1
+        if start >= len(offsets):
+            return None
+        return text[offsets[start][0]:].strip() or None
+
+    def chunk(self, text):
+        blocks = split_blocks(text)
+        counts = self.count([block for block, _ in blocks])
+        chunks = []
+        current = []
+        used = 0
+        has_body = False
+
+        def emit():
+            nonlocal used, has_body
+            if current:
+                chunks.append("\n\n".join(current))
+                current.clear()
+            used = 0
+            has_body = False
+
+        for (block, starts_section), n in zip(blocks, counts):
+            if starts_section:
+                # Consecutive headings stay together with the body that follows
+                if has_body:
+                    emit()
+            elif current and used + n > self.max_tokens:
+                previous = "\n\n".join(current)
+                emit()
+                carry = self.tail(previous)
+                if carry:
+                    carry_tokens = self.count([carry])[0]
+                    if carry_tokens + n <= self.max_tokens:
+                        current.append(carry)
+                        used = carry_tokens
+
+            if n > self.max_tokens:
+                # Window the pending headings together with the oversized block
+                chunks.extend(self.windows("\n\n".join(current + [block])))
+                current.clear()
+                used = 0
+                has_body = False
+                continue
+            current.append(block)
+            used += n
+            has_body = has_body or not starts_section
+        emit()
+        return chunks
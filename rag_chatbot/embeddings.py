@@ -0,0 +1,248 @@
+"""Embedding engines for the indexer and the API.
+
+"torch" serves SentenceTransformer as before. "onnx" and "onnx-int8" export
+the model once to ONNX (the latter with dynamic int8 weight quantization),
+cache the export under onnx_model/, and serve encode() through ONNX Runtime
+with only numpy and tokenizers, so serving never imports torch.
+
+    python embeddings.py --parity      # compare an ONNX engine with torch
+    python embeddings.py --benchmark   # single-query latency and RSS per engine
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_NAME = "all-MiniLM-L6-v2"
+ONNX_CACHE_DIR = os.path.join(BASE_DIR, "onnx_model")
+
+# "torch", "onnx" or "onnx-int8"
+EMBEDDING_ENGINE = os.getenv("RAG_EMBEDDING_ENGINE", "torch")
+ENGINES = ("torch", "onnx", "onnx-int8")
+
+def embedding_id(model_name=MODEL_NAME, engine=EMBEDDING_ENGINE):
+    """Key for cached embeddings; engines differ slightly, so they never share entries."""
+    return model_name if engine == "torch" else f"{model_name}@{engine}"
+
+def export_dir(model_name, cache_dir=ONNX_CACHE_DIR):
+    return os.path.join(cache_dir, model_name.strip("/").replace("/", "__"))
+
+def export_onnx(model_name=MODEL_NAME, cache_dir=ONNX_CACHE_DIR, quantize=False):
+    """Export the model's transformer to ONNX once and return the .onnx path.
+
+    Pooling, normalization and max_seq_length are read from the
+    SentenceTransformer pipeline and saved next to the tokenizer.
+    """
+    target = export_dir(model_name, cache_dir)
+    fp32_path = os.path.join(target, "model.onnx")
+    int8_path = os.path.join(target, "model.int8.onnx")
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        print(f"Exporting {model_name} to ONNX...")
+        st = SentenceTransformer(model_name, device="cpu")
+        modules = list(st)
+        pooling = next(m for m in modules if type(m).__name__ == "Pooling")
+        mode = getattr(pooling, "pooling_mode", None) or pooling.get_pooling_mode_str()
+        if mode not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling mode for ONNX export: {mode}")
+
+        os.makedirs(target, exist_ok=True)
+        st.tokenizer.save_pretrained(target)
+        with open(os.path.join(target, "engine_config.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "model": model_name,
+                "max_seq_length": st.max_seq_length,
+                "pooling": mode,
+                "normalize": any(type(m).__name__ == "Normalize" for m in modules),
+            }, f, indent=2)
+
+        class Encoder(torch.nn.Module):
+            """Positional inputs in, token embeddings out, as the ONNX graph expects."""
+
+            def __init__(self, transformer):
+                super().__init__()
+                self.transformer = transformer
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                return self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                        token_type_ids=token_type_ids).last_hidden_state
+
+        sample = st.tokenizer(["an example sentence"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+        dynamic = {n: {0: "batch", 1: "sequence"} for n in names}
+        dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        tmp_path = fp32_path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                Encoder(modules[0].auto_model).eval(), tuple(sample[n] for n in names), tmp_path,
+                input_names=names, output_names=["last_hidden_state"],
+                dynamic_axes=dynamic, opset_version=17, dynamo=False,
+            )
+        os.replace(tmp_path, fp32_path)
+
+    if quantize and not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("Quantizing ONNX model to int8...")
+        tmp_path = int8_path + ".tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+
+    return int8_path if quantize else fp32_path
+
+class OnnxEncoder:
+    """SentenceTransformer-compatible encode() backed by ONNX Runtime."""
+
+    def __init__(self, model_name=MODEL_NAME, quantize=False, cache_dir=ONNX_CACHE_DIR, threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = export_onnx(model_name, cache_dir, quantize)
+        target = export_dir(model_name, cache_dir)
+        with open(os.path.join(target, "engine_config.json"), encoding="utf-8") as f:
+            config = json.load(f)
+        self.max_seq_length = config["max_seq_length"]
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(target, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Sort by length so each batch pads as little as possible, then restore order
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            for i, vector in zip(idx, self._encode_batch([texts[i] for i in idx])):
+                out[i] = vector
+        vectors = np.stack(out)
+        return vectors[0] if single else vectors
+
+def set_torch_threads(threads):
+    """Cap torch's intra-op threads (0 leaves the current setting)."""
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+def load_encoder(engine=EMBEDDING_ENGINE, model_name=MODEL_NAME, threads=0):
+    """An object with SentenceTransformer's encode() for the chosen engine.
+
+    `threads` caps intra-op threads (0 keeps the library default, all cores).
+    """
+    if engine == "torch":
+        from sentence_transformers import SentenceTransformer
+        set_torch_threads(threads)
+        return SentenceTransformer(model_name)
+    if engine in ("onnx", "onnx-int8"):
+        return OnnxEncoder(model_name, quantize=engine == "onnx-int8", threads=threads)
+    raise ValueError(f"Unknown embedding engine: {engine}")
+
+SAMPLE_QUERIES = [
+    "How do humanoid robots balance?",
+    "What is a PID controller?",
+    "zero moment point walking",
+    "Which sensors measure joint position?",
+    "Explain inverse kinematics for a robot arm in simple terms.",
+    "actuators",
+]
+
+def check_parity(engine, model_name=MODEL_NAME, min_cosine=None):
+    """Compare an ONNX engine's embeddings with torch; returns True when close enough."""
+    min_cosine = min_cosine or (0.99 if engine == "onnx-int8" else 0.9999)
+    reference = load_encoder("torch", model_name).encode(SAMPLE_QUERIES)
+    candidate = load_encoder(engine, model_name).encode(SAMPLE_QUERIES)
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+    max_diff = float(np.abs(reference - candidate).max())
+    print(f"{engine} vs torch: min cosine {cosine.min():.6f}, max abs diff {max_diff:.2e} "
+          f"(threshold {min_cosine})")
+    return bool(cosine.min() >= min_cosine)
+
+def benchmark(engine, model_name=MODEL_NAME, runs=50):
+    """Load time, single-query latency and peak RSS for one engine (run in a fresh process)."""
+    import resource
+
+    start = time.perf_counter()
+    encoder = load_encoder(engine, model_name)
+    load_s = time.perf_counter() - start
+    encoder.encode(SAMPLE_QUERIES[0])
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        encoder.encode(SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)])
+        latencies.append(time.perf_counter() - start)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    print(json.dumps({
+        "engine": engine,
+        "load_s": round(load_s, 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "peak_rss_mb": round(rss, 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, check and benchmark embedding engines.")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--engine", choices=ENGINES, help="Engine to export, check or benchmark")
+    parser.add_argument("--export", action="store_true", help="Export the ONNX model(s) and exit")
+    parser.add_argument("--parity", action="store_true", help="Check ONNX embeddings against torch")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Report latency and RSS, one subprocess per engine")
+    args = parser.parse_args()
+
+    engines = [args.engine] if args.engine else [e for e in ENGINES if e != "torch"]
+    if args.export:
+        for engine in engines:
+            export_onnx(args.model, quantize=engine == "onnx-int8")
+    if args.parity:
+        results = [check_parity(engine, args.model) for engine in engines if engine != "torch"]
+        if not all(results):
+            sys.exit(1)
+    if args.benchmark:
+        import subprocess
+        if args.engine:
+            benchmark(args.engine, args.model)
+        else:
+            # Separate processes so each engine's RSS and import cost are measured alone
+            for engine in ENGINES:
+                subprocess.run([sys.executable, __file__, "--benchmark", "--engine", engine, "--model", args.model],
+                               check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Export a torch-free retrieval artifact for the serverless chat function.
+
+Packs the indexed chunks into one .npz that book/api/index.py loads with
+NumPy alone:
+
+- the BM25 index from lexical_index.json as a term-major sparse matrix
+  (indptr / rows / weights) with its vocabulary and IDF;
+- a static embedding table: every vocabulary term encoded once by the
+  embedding model, so a query vector is the IDF-weighted mean of its
+  terms' vectors, scored against the chunk vectors from the vector store
+  (both float16);
+- chunk payloads and the index version, as JSON.
+
+Run it after indexer.py; --no-dense skips the embedding table.
+
+    python export_artifact.py
+    python export_artifact.py --output /tmp/retrieval_index.npz --no-dense
+"""
+import os
+import json
+import math
+import time
+import argparse
+import numpy as np
+from vector_store import QUANTIZATION, VECTOR_BACKEND, open_store
+from lexical import LexicalIndex
+from indexer import load_manifest, load_model
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACT_PATH = os.path.normpath(os.path.join(BASE_DIR, "../book/api/retrieval_index.npz"))
+ARTIFACT_FORMAT = 1
+
+def as_bytes(value):
+    return np.frombuffer(json.dumps(value, separators=(",", ":")).encode("utf-8"), dtype=np.uint8)
+
+def build_artifact(store, lexical, encoder=None, path=ARTIFACT_PATH, manifest=None, batch_size=256):
+    """Write the artifact for `store` and `lexical`; returns (chunks, terms).
+
+    Chunks are stored in book order (the manifest's per-file point order),
+    so the serverless side can present retrieved chunks in reading order.
+    """
+    manifest = manifest or {}
+    position = {point_id: i for i, point_id in
+                enumerate(p for name in sorted(manifest.get("files", {})) for p in manifest["files"][name]["points"])}
+    points = sorted(store.points(), key=lambda point: position.get(point[0], len(position)))
+    ids = [point_id for point_id, _, _ in points]
+    vectors = [np.asarray(vector, dtype=np.float32) for _, vector, _ in points]
+    chunks = [{"file": payload.get("filename", ""), "heading": payload.get("title", ""),
+               "text": payload.get("content", "")} for _, _, payload in points]
+    rows = {point_id: row for row, point_id in enumerate(ids)}
+
+    lexical.finalize()
+    terms = sorted(lexical.postings)
+    indptr = [0]
+    posting_rows, weights = [], []
+    for term in terms:
+        for point_id, weight in lexical.postings[term]:
+            if point_id in rows:
+                posting_rows.append(rows[point_id])
+                weights.append(weight)
+        indptr.append(len(posting_rows))
+    df = np.diff(indptr)
+    n = len(chunks)
+    idf = np.array([math.log(1 + (n - d + 0.5) / (d + 0.5)) for d in df], dtype=np.float32)
+
+    arrays = {
+        "meta": as_bytes({"format": ARTIFACT_FORMAT, "version": manifest.get("version"), "created": time.time(),
+                          "dense": encoder is not None}),
+        "terms": as_bytes(terms),
+        "chunks": as_bytes(chunks),
+        "indptr": np.asarray(indptr, dtype=np.int32),
+        "rows": np.asarray(posting_rows, dtype=np.int32),
+        "weights": np.asarray(weights, dtype=np.float32),
+        "idf": idf,
+    }
+    if encoder is not None:
+        term_vectors = encoder.encode(terms, batch_size=batch_size) if terms else np.zeros((0, 0))
+        term_vectors = np.asarray(term_vectors, dtype=np.float32)
+        term_vectors /= np.maximum(np.linalg.norm(term_vectors, axis=1, keepdims=True), 1e-12)
+        arrays["term_vectors"] = term_vectors.astype(np.float16)
+        arrays["chunk_vectors"] = np.asarray(vectors, dtype=np.float16)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    return n, len(terms)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=ARTIFACT_PATH)
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default=VECTOR_BACKEND)
+    parser.add_argument("--no-dense", action="store_true", help="BM25 only; skip the static embedding table")
+    args = parser.parse_args()
+
+    store = open_store(args.backend, quantization=QUANTIZATION)
+    try:
+        encoder = None
+        if not args.no_dense:
+            encoder = load_model()
+        chunks, terms = build_artifact(store, LexicalIndex.load(), encoder, args.output, load_manifest())
+    finally:
+        store.close()
+    size = os.path.getsize(args.output) / 2**20
+    print(f"Wrote {args.output}: {chunks} chunks, {terms} terms, {size:.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
 import os
 import glob
 import re
+import json
+import uuid
+import queue
+import sqlite3
+import hashlib
+import time
+import argparse
+import threading
 import yaml
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from sentence_transformers import SentenceTransformer
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from vector_store import QUANTIZATION, SNAPSHOT_PATH, VECTOR_BACKEND, open_store, write_snapshot
+from lexical import LEXICAL_INDEX_PATH, LexicalIndex
+from chunking import TokenChunker
+from embeddings import EMBEDDING_ENGINE, embedding_id, load_encoder
 
 # Configuration
 # Configuration
@@ -13,26 +26,42 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOCS_PATH = os.path.join(BASE_DIR, "../book/docs") # Assuming book is sibling to rag_chatbot
 # Normalizing the path
 DOCS_PATH = os.path.normpath(DOCS_PATH)
-QDRANT_PATH = os.path.join(BASE_DIR, "qdrant_storage")
 
 # QDRANT_HOST = "localhost" # Not used for local path based client
 # QDRANT_PORT = 6333
-COLLECTION_NAME = "physical_ai_book"
+# Storage paths and collection name live in vector_store.py
 MODEL_NAME = "all-MiniLM-L6-v2"
+MANIFEST_PATH = os.path.join(BASE_DIR, "index_manifest.json")
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.sqlite")
+
+# Pipeline tuning (parse -> chunk -> encode -> upsert)
+ENCODE_BATCH_SIZE = int(os.getenv("INDEX_ENCODE_BATCH_SIZE", "64"))
+UPSERT_BATCH_SIZE = int(os.getenv("INDEX_UPSERT_BATCH_SIZE", "256"))
+# Each parse worker loads its own tokenizer, so keep the default low next to the encoder
+PARSE_WORKERS = int(os.getenv("INDEX_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+QUEUE_SIZE = int(os.getenv("INDEX_QUEUE_SIZE", "8"))
+# Chunk size in model tokens (0 = the model's max_seq_length) and overlap between chunks
+CHUNK_TOKENS = int(os.getenv("INDEX_CHUNK_TOKENS", "0"))
+CHUNK_OVERLAP = int(os.getenv("INDEX_CHUNK_OVERLAP", "32"))
+# Seconds of quiet after the last save before a watched file is re-indexed
+WATCH_DEBOUNCE = float(os.getenv("INDEX_WATCH_DEBOUNCE", "0.3"))
+
+_DONE = object()
 
 def get_files():
     return glob.glob(os.path.join(DOCS_PATH, "*.md"))
 
-def parse_markdown(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+def parse_markdown(file_path, content=None):
+    if content is None:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
     
-    # Split Frontmatter
-    parts = re.split(r'^---$', content, flags=re.MULTILINE)
+    # Split Frontmatter (only the leading block; later '---' lines are horizontal rules)
+    parts = re.split(r'^---$', content, maxsplit=2, flags=re.MULTILINE)
     metadata = {}
     text = content
     
-    if len(parts) >= 3:
+    if len(parts) == 3 and not parts[0].strip():
         try:
             metadata = yaml.safe_load(parts[1])
             text = parts[2]
@@ -41,52 +70,512 @@ def parse_markdown(file_path):
             
     return text.strip(), metadata
 
-def chunk_text(text, chunk_size=500, overlap=50):
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    return chunks
-
-def index_book():
-    print("Connecting to local Qdrant (embedded)...")
-    # Use local storage path
-    client = QdrantClient(path=QDRANT_PATH)
-    
-    print(f"Loading model {MODEL_NAME}...")
-    model = SentenceTransformer(MODEL_NAME)
-    
-    print(f"Recreating collection '{COLLECTION_NAME}'...")
-    client.recreate_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE),
-    )
+_chunker = None
+
+def get_chunker():
+    """Tokenizer-backed chunker, loaded once per (worker) process."""
+    global _chunker
+    if _chunker is None:
+        _chunker = TokenChunker.for_model(MODEL_NAME, CHUNK_TOKENS, CHUNK_OVERLAP)
+    return _chunker
+
+def chunk_text(text):
+    return get_chunker().chunk(text)
+
+def chunking_config():
+    """Recorded in the manifest; changing it forces a rebuild."""
+    return {"max_tokens": CHUNK_TOKENS, "overlap": CHUNK_OVERLAP, "splitter": "markdown-tokens"}
+
+def content_hash(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_ids(filename, chunks):
+    """Deterministic point IDs from the file name and each chunk's content hash.
+
+    Repeated identical chunks in one file are told apart by an occurrence
+    counter, so IDs survive edits elsewhere in the file.
+    """
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        chunk_hash = content_hash(chunk)
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        digest = hashlib.sha256(f"{filename}\0{chunk_hash}\0{occurrence}".encode('utf-8')).digest()
+        ids.append((str(uuid.UUID(bytes=digest[:16])), chunk_hash))
+    return ids
+
+def load_document(file_path, known_hash=None):
+    """Parse and chunk one file. Runs inside a worker process.
+
+    Returns (filename, file_hash, metadata, chunks); metadata and chunks are
+    None when the file still matches `known_hash`.
+    """
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    file_hash = content_hash(raw)
+    filename = Path(file_path).name
+    if file_hash == known_hash:
+        return filename, file_hash, None, None
+    text, metadata = parse_markdown(file_path, raw.decode('utf-8'))
+    return filename, file_hash, metadata or {}, chunk_text(text)
+
+def iter_documents(files, known_hashes=None, workers=PARSE_WORKERS, window=QUEUE_SIZE):
+    """Yield load_document() results per file, parsing across processes.
+
+    At most `window` files are in flight at once, so a huge corpus never
+    gets fully materialised in memory.
+    """
+    known_hashes = known_hashes or {}
+    if workers <= 1:
+        for file_path in files:
+            yield load_document(file_path, known_hashes.get(Path(file_path).name))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for file_path in files:
+            known_hash = known_hashes.get(Path(file_path).name)
+            pending.append(pool.submit(load_document, file_path, known_hash))
+            if len(pending) >= window:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"model": None, "collection": None, "files": {}}
+
+def new_index_version():
+    """Stamp recorded in the manifest whenever the index changes; the API keys cached responses on it."""
+    return uuid.uuid4().hex
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+class EmbeddingCache:
+    """On-disk chunk embeddings keyed by (model and engine, chunk hash)."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, model_name=None):
+        model_name = model_name or embedding_id(MODEL_NAME)
+        self.model_name = model_name
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, chunk_hash TEXT, vector BLOB, PRIMARY KEY (model, chunk_hash))"
+        )
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(set(hashes))
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? "
+                f"AND chunk_hash IN ({','.join('?' * len(part))})",
+                [self.model_name, *part],
+            )
+            for chunk_hash, blob in rows:
+                found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+            [(self.model_name, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def build_points(items, cache, get_model, batch_size=ENCODE_BATCH_SIZE):
+    """Turn (point_id, chunk_hash, payload) items into (id, vector, payload) points.
+
+    Only chunks never embedded with this model hit the transformer; the rest
+    come from the embedding cache. Returns (points, number_embedded).
+    """
+    vectors = cache.get_many([chunk_hash for _, chunk_hash, _ in items])
+    missing = {chunk_hash: payload["content"] for _, chunk_hash, payload in items
+               if chunk_hash not in vectors}
+    if missing:
+        encoded = get_model().encode(list(missing.values()), batch_size=batch_size)
+        fresh = list(zip(missing.keys(), encoded))
+        cache.put_many(fresh)
+        vectors.update(fresh)
+
+    points = [(point_id, vectors[chunk_hash], payload) for point_id, chunk_hash, payload in items]
+    return points, len(missing)
+
+def document_items(filename, metadata, chunks):
+    """(point_id, chunk_hash, payload) for every chunk of one document."""
+    items = []
+    for chunk, (point_id, chunk_hash) in zip(chunks, chunk_ids(filename, chunks)):
+        payload = {
+            "filename": filename,
+            "content": chunk,
+            **metadata
+        }
+        items.append((point_id, chunk_hash, payload))
+    return items
+
+def load_model():
+    print(f"Loading model {MODEL_NAME} ({EMBEDDING_ENGINE} engine)...")
+    return load_encoder(EMBEDDING_ENGINE, MODEL_NAME)
+
+def lazy_model():
+    """Callable returning the model, loading it on first use only."""
+    model = None
+    def get_model():
+        nonlocal model
+        if model is None:
+            model = load_model()
+        return model
+    return get_model
+
+def _run_stage(target, errors, *args):
+    """Run a pipeline stage in a thread, recording any failure for the caller."""
+    def runner():
+        try:
+            target(*args)
+        except BaseException as e:
+            errors.append(e)
+    thread = threading.Thread(target=runner, daemon=True)
+    thread.start()
+    return thread
+
+def _put(q, item, errors):
+    """Blocking put that gives up once another stage has failed."""
+    while not errors:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, errors):
+    """Blocking get that returns the end marker once another stage has failed."""
+    while not errors:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def _chunk_stage(files, out_q, errors, workers, window, old_files, new_files):
+    known_hashes = {name: entry["file_hash"] for name, entry in old_files.items()}
+    try:
+        for filename, file_hash, metadata, chunks in iter_documents(files, known_hashes, workers, window):
+            if chunks is None:
+                new_files[filename] = old_files[filename]
+                continue
+            print(f"  - {filename}: {len(chunks)} chunks")
+            items = document_items(filename, metadata, chunks)
+            new_files[filename] = {"file_hash": file_hash, "points": [item[0] for item in items]}
+            for item in items:
+                if not _put(out_q, item, errors):
+                    return
+    finally:
+        _put(out_q, _DONE, errors)
+
+def _upsert_stage(store, in_q, errors, upsert_batch_size):
+    batch = []
+    while True:
+        item = _get(in_q, errors)
+        if item is _DONE:
+            break
+        batch.extend(item)
+        if len(batch) >= upsert_batch_size:
+            store.upsert(batch[:upsert_batch_size])
+            batch = batch[upsert_batch_size:]
+    if batch and not errors:
+        store.upsert(batch)
+
+def index_book(encode_batch_size=ENCODE_BATCH_SIZE, upsert_batch_size=UPSERT_BATCH_SIZE,
+               workers=PARSE_WORKERS, queue_size=QUEUE_SIZE, rebuild=False, store=None,
+               backend=VECTOR_BACKEND, quantization=QUANTIZATION, cache_path=EMBEDDING_CACHE_PATH):
+    """Bring the store up to date with the docs and return counts of what was done."""
+    if store is None:
+        print(f"Opening {backend} vector store (quantization: {quantization})...")
+        store = open_store(backend, quantization=quantization)
+
+    manifest = load_manifest()
+    if (rebuild or manifest.get("model") != embedding_id(MODEL_NAME) or manifest.get("backend") != backend
+            or manifest.get("quantization") != quantization
+            or manifest.get("chunking") != chunking_config()
+            or not store.exists() or not os.path.exists(LEXICAL_INDEX_PATH)):
+        print(f"Recreating {backend} vector store...")
+        store.reset()
+        manifest = {"model": embedding_id(MODEL_NAME), "backend": backend, "quantization": quantization,
+                    "chunking": chunking_config(), "files": {}}
+        lexical = LexicalIndex()
+    else:
+        lexical = LexicalIndex.load()
     
     files = get_files()
-    points = []
-    idx = 0
-    
-    print(f"Indexing {len(files)} files...")
-    for file_path in files:
-        filename = Path(file_path).name
-        text, metadata = parse_markdown(file_path)
-        chunks = chunk_text(text)
-        
-        print(f"  - {filename}: {len(chunks)} chunks")
-        
-        for chunk in chunks:
-            vector = model.encode(chunk).tolist()
-            payload = {
-                "filename": filename,
-                "content": chunk,
-                **metadata
-            }
-            points.append(models.PointStruct(id=idx, vector=vector, payload=payload))
-            idx += 1
-            
-    client.upsert(collection_name=COLLECTION_NAME, points=points)
-    print(f"Successfully indexed {len(points)} chunks into '{COLLECTION_NAME}'.")
+    print(f"Indexing {len(files)} files "
+          f"(workers={workers}, encode_batch={encode_batch_size}, upsert_batch={upsert_batch_size})...")
+
+    # Bounded queues keep memory flat: each stage blocks when the next falls behind
+    errors = []
+    new_files = {}
+    chunk_q = queue.Queue(maxsize=queue_size * encode_batch_size)
+    point_q = queue.Queue(maxsize=queue_size)
+    producer = _run_stage(_chunk_stage, errors, files, chunk_q, errors, workers, queue_size,
+                          manifest["files"], new_files)
+    consumer = _run_stage(_upsert_stage, errors, store, point_q, errors, upsert_batch_size)
+
+    cache = EmbeddingCache(cache_path)
+    get_model = lazy_model()
+    upserted = embedded = 0
+    done = False
+    try:
+        while not done and not errors:
+            items = []
+            while len(items) < encode_batch_size:
+                item = _get(chunk_q, errors)
+                if item is _DONE:
+                    done = True
+                    break
+                items.append(item)
+            if not items:
+                continue
+
+            points, fresh = build_points(items, cache, get_model, encode_batch_size)
+            for point_id, _, payload in items:
+                lexical.add(point_id, payload["content"])
+            embedded += fresh
+            upserted += len(points)
+            if not _put(point_q, points, errors):
+                break
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        _put(point_q, _DONE, errors)
+        consumer.join()
+        producer.join(timeout=1)
+        cache.close()
+
+    if errors:
+        raise errors[0]
+
+    # Points from deleted files or edited-away chunks
+    live = {point_id for entry in new_files.values() for point_id in entry["points"]}
+    stale = [point_id for entry in manifest["files"].values() for point_id in entry["points"]
+             if point_id not in live]
+    if stale:
+        store.delete(stale)
+    store.flush()
+    lexical.remove(stale)
+    lexical.save()
+
+    manifest["files"] = new_files
+    if upserted or stale or "version" not in manifest:
+        manifest["version"] = new_index_version()
+    save_manifest(manifest)
+    print(f"Indexed {len(live)} chunks into the {backend} store "
+          f"({upserted} upserted, {embedded} embedded, {len(stale)} stale removed).")
+    return {"files": len(files), "chunks": len(live), "upserted": upserted, "embedded": embedded,
+            "stale": len(stale)}
+
+def index_file(store, cache, get_model, file_path, manifest=None, lexical=None):
+    """Bring the points of a single doc in line with its current contents.
+
+    Both the vector store and the lexical index are updated. Deleted files
+    have all their points removed. Returns a one-line summary, or None when
+    the file has not changed since it was last indexed.
+    """
+    manifest = manifest if manifest is not None else load_manifest()
+    lexical = lexical if lexical is not None else LexicalIndex.load_or_empty()
+    filename = Path(file_path).name
+    old_entry = manifest["files"].get(filename)
+    old_points = set(old_entry["points"]) if old_entry else set()
+
+    if not os.path.exists(file_path):
+        if old_points:
+            store.delete(old_points)
+            store.flush()
+            lexical.remove(old_points)
+            lexical.save()
+        manifest["files"].pop(filename, None)
+        manifest["version"] = new_index_version()
+        save_manifest(manifest)
+        return f"{filename}: removed {len(old_points)} chunks"
+
+    filename, file_hash, metadata, chunks = load_document(file_path, old_entry and old_entry["file_hash"])
+    if chunks is None:
+        return None
+
+    items = document_items(filename, metadata, chunks)
+    points, embedded = build_points(items, cache, get_model)
+    if points:
+        store.upsert(points)
+    live = [item[0] for item in items]
+    stale = list(old_points.difference(live))
+    if stale:
+        store.delete(stale)
+    store.flush()
+    for point_id, _, payload in items:
+        lexical.add(point_id, payload["content"])
+    lexical.remove(stale)
+    lexical.save()
+
+    manifest["files"][filename] = {"file_hash": file_hash, "points": live}
+    manifest["version"] = new_index_version()
+    save_manifest(manifest)
+    return f"{filename}: {len(live)} chunks ({embedded} embedded, {len(stale)} stale removed)"
+
+class DocsWatcher(FileSystemEventHandler):
+    """Re-index docs as they are saved, debouncing bursts of events per file.
+
+    Embedded Qdrant storage can only be opened by one process, so api.py runs
+    this in-process with its own store; `indexer.py --watch` runs it alone.
+    `lock` serialises index writes with whatever else uses the store.
+    """
+
+    def __init__(self, store, get_model, lock=None, debounce=WATCH_DEBOUNCE, docs_path=DOCS_PATH,
+                 lexical=None, on_change=None):
+        self.store = store
+        # Called with the summary after each successful re-index
+        self.on_change = on_change
+        self.get_model = get_model
+        self.lexical = lexical if lexical is not None else LexicalIndex.load_or_empty()
+        self.lock = lock or threading.Lock()
+        self.debounce = debounce
+        self.docs_path = docs_path
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.observer = None
+        self.worker = None
+
+    def _touch(self, path):
+        if path and path.endswith(".md") and os.path.dirname(os.path.abspath(path)) == self.docs_path:
+            with self.pending_lock:
+                self.pending[path] = time.monotonic()
+
+    def on_any_event(self, event):
+        # Ignore open/close-without-write events, including our own reads
+        if event.is_directory or event.event_type not in ("created", "modified", "deleted", "moved", "closed"):
+            return
+        # Editors often save via a temp file + rename, so track both ends of a move
+        self._touch(event.src_path)
+        self._touch(getattr(event, "dest_path", None))
+
+    def _due(self):
+        now = time.monotonic()
+        with self.pending_lock:
+            due = [path for path, seen in self.pending.items() if now - seen >= self.debounce]
+            for path in due:
+                del self.pending[path]
+        return due
+
+    def _run(self):
+        cache = EmbeddingCache()
+        try:
+            while not self.stopped.wait(0.05):
+                for path in self._due():
+                    start = time.perf_counter()
+                    try:
+                        with self.lock:
+                            summary = index_file(self.store, cache, self.get_model, path,
+                                                     lexical=self.lexical)
+                        if summary:
+                            print(f"  ~ {summary} in {time.perf_counter() - start:.2f}s")
+                            if self.on_change:
+                                self.on_change(summary)
+                    except Exception as e:
+                        print(f"  ! Failed to re-index {path}: {e}")
+        finally:
+            cache.close()
+
+    def start(self):
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+        self.observer = Observer()
+        self.observer.schedule(self, self.docs_path, recursive=False)
+        self.observer.start()
+        print(f"Watching {self.docs_path} for changes...")
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+        if self.worker:
+            self.worker.join()
+
+def snapshot_index(store, quantization=QUANTIZATION):
+    """Publish the current index as the read-only snapshot served by api.py --workers N."""
+    count = write_snapshot(store, quantization=quantization, extra_files=[LEXICAL_INDEX_PATH, MANIFEST_PATH])
+    print(f"Wrote index snapshot with {count} points to {SNAPSHOT_PATH}")
+
+def watch_book(snapshot=False, **index_options):
+    """Catch the index up with the docs, then apply edits until interrupted."""
+    store = open_store(index_options.get("backend", VECTOR_BACKEND),
+                       quantization=index_options.get("quantization", QUANTIZATION))
+    index_book(store=store, **index_options)
+    if snapshot:
+        snapshot_index(store, index_options.get("quantization", QUANTIZATION))
+    watcher = DocsWatcher(store, lazy_model()).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Index the book into the vector store.")
+    parser.add_argument("--backend", choices=["qdrant", "numpy"], default=VECTOR_BACKEND,
+                        help="Vector store to write (default: $RAG_VECTOR_BACKEND or qdrant)")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default=QUANTIZATION,
+                        help="First-pass vector quantization (default: $RAG_QUANTIZATION or none)")
+    parser.add_argument("--encode-batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--upsert-batch-size", type=int, default=UPSERT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS,
+                        help="Processes used for parsing and chunking (default: $INDEX_PARSE_WORKERS "
+                             "or min(4, CPUs))")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="Batches buffered between pipeline stages")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Drop the collection and manifest and index everything again")
+    parser.add_argument("--watch", action="store_true",
+                        help="After indexing, keep re-indexing docs as they change")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Also write the read-only snapshot served by api.py --workers N "
+                             "(with --watch, once after catching up)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    index_book()
+    args = parse_args()
+    options = dict(
+        encode_batch_size=args.encode_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        rebuild=args.rebuild,
+        backend=args.backend,
+        quantization=args.quantization,
+    )
+    if args.watch:
+        watch_book(snapshot=args.snapshot, **options)
+    else:
+        store = open_store(args.backend, quantization=args.quantization)
+        try:
+            index_book(store=store, **options)
+            if args.snapshot:
+                snapshot_index(store, args.quantization)
+        finally:
+            store.close()
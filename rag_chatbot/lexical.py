@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter, defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXICAL_INDEX_PATH = os.path.join(BASE_DIR, "lexical_index.json")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it its of on or "
+    "that the their this to was what when where which who why with".split()
+)
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts, keyed by point ID.
+
+    Per-document term counts are kept so the index can be updated
+    incrementally; finalize() turns them into postings whose entries already
+    hold the full BM25 weight, so a query is only a few dict lookups and adds.
+    """
+
+    def __init__(self, docs=None, postings=None):
+        self.docs = docs or {}          # point_id -> {"len": n, "tf": {term: count}}
+        self.postings = postings        # term -> [[point_id, weight], ...]
+        if self.postings is None:
+            self.finalize()
+
+    @classmethod
+    def load(cls, path=LEXICAL_INDEX_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["docs"], data["postings"])
+
+    @classmethod
+    def load_or_empty(cls, path=LEXICAL_INDEX_PATH):
+        try:
+            return cls.load(path)
+        except (OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, path=LEXICAL_INDEX_PATH):
+        self.finalize()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs, "postings": self.postings}, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def add(self, point_id, text):
+        tokens = tokenize(text)
+        self.docs[point_id] = {"len": len(tokens), "tf": dict(Counter(tokens))}
+
+    def remove(self, point_ids):
+        for point_id in point_ids:
+            self.docs.pop(point_id, None)
+
+    def finalize(self):
+        """Recompute postings with precomputed BM25 weights after add/remove."""
+        n = len(self.docs)
+        avgdl = sum(d["len"] for d in self.docs.values()) / n if n else 0.0
+        df = Counter(term for d in self.docs.values() for term in d["tf"])
+        postings = defaultdict(list)
+        for point_id, d in self.docs.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * d["len"] / avgdl) if avgdl else BM25_K1
+            for term, tf in d["tf"].items():
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                postings[term].append([point_id, idf * tf * (BM25_K1 + 1) / (tf + norm)])
+        self.postings = dict(postings)
+
+    def search(self, query, limit):
+        """Top `limit` (point_id, score) pairs by BM25."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for point_id, weight in self.postings.get(term, ()):
+                scores[point_id] += weight
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def __len__(self):
+        return len(self.docs)
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked ID lists into [(id, score)], best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, point_id in enumerate(ranking):
+            scores[point_id] += 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,388 @@
+import os
+import json
+import math
+import shutil
+from collections import namedtuple
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QDRANT_PATH = os.path.join(BASE_DIR, "qdrant_storage")
+NUMPY_STORE_PATH = os.path.join(BASE_DIR, "vector_store")
+# Immutable, memory-mapped copy of the index shared by multi-worker serving
+SNAPSHOT_PATH = os.path.join(BASE_DIR, "index_snapshot")
+COLLECTION_NAME = "physical_ai_book"
+VECTOR_SIZE = 384
+
+# "qdrant" (embedded Qdrant) or "numpy" (memory-mapped .npy + payload file)
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "qdrant")
+# First-pass vector quantization: "none", "int8" (4x smaller) or "binary" (32x smaller).
+# Candidates are rescored against the full-precision vectors kept on disk.
+QUANTIZATION = os.getenv("RAG_QUANTIZATION", "none")
+# Candidates rescored per requested result when quantization is on (default per mode)
+RESCORE_OVERSAMPLING = float(os.getenv("RAG_RESCORE_OVERSAMPLING", "0")) or None
+DEFAULT_OVERSAMPLING = {"none": 1.0, "int8": 4.0, "binary": 10.0}
+
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+
+class VectorStore:
+    """Minimal interface shared by the indexer and the API.
+
+    Points are (id, vector, payload) tuples; searches return lists of Hit
+    ordered by descending cosine similarity.
+    """
+
+    def exists(self):
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop everything and start an empty store."""
+        raise NotImplementedError
+
+    def upsert(self, points):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def flush(self):
+        """Make pending writes durable. A no-op for stores that write through."""
+
+    def count(self):
+        raise NotImplementedError
+
+    def retrieve(self, ids):
+        """Hits (with a score of 0) for the given IDs, skipping unknown ones."""
+        raise NotImplementedError
+
+    def points(self, batch_size=1024):
+        """Iterate over every stored (id, vector, payload)."""
+        raise NotImplementedError
+
+    def search(self, vector, limit):
+        return self.search_batch([vector], [limit])[0]
+
+    def search_batch(self, vectors, limits):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class QdrantStore(VectorStore):
+    """Embedded Qdrant collection (single process only)."""
+
+    def __init__(self, path=QDRANT_PATH, collection_name=COLLECTION_NAME, client=None,
+                 quantization=QUANTIZATION, oversampling=RESCORE_OVERSAMPLING):
+        from qdrant_client import QdrantClient
+        from qdrant_client.http import models
+        self.models = models
+        self.collection_name = collection_name
+        self.client = client or QdrantClient(path=path)
+        self.quantization = quantization
+        self.search_params = None
+        if quantization != "none":
+            self.search_params = models.SearchParams(
+                quantization=models.QuantizationSearchParams(
+                    rescore=True, oversampling=oversampling or DEFAULT_OVERSAMPLING[quantization])
+            )
+
+    def _quantization_config(self):
+        if self.quantization == "int8":
+            return self.models.ScalarQuantization(
+                scalar=self.models.ScalarQuantizationConfig(type=self.models.ScalarType.INT8, always_ram=True)
+            )
+        if self.quantization == "binary":
+            return self.models.BinaryQuantization(binary=self.models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def exists(self):
+        return any(c.name == self.collection_name for c in self.client.get_collections().collections)
+
+    def reset(self):
+        # With quantization the originals only serve rescoring, so they can stay on disk
+        self.client.recreate_collection(
+            collection_name=self.collection_name,
+            vectors_config=self.models.VectorParams(size=VECTOR_SIZE, distance=self.models.Distance.COSINE,
+                                                    on_disk=self.quantization != "none"),
+            quantization_config=self._quantization_config(),
+        )
+
+    def upsert(self, points):
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[self.models.PointStruct(id=i, vector=list(map(float, v)), payload=p) for i, v, p in points],
+        )
+
+    def delete(self, ids):
+        self.client.delete(collection_name=self.collection_name,
+                           points_selector=self.models.PointIdsList(points=list(ids)))
+
+    def count(self):
+        return self.client.count(self.collection_name).count
+
+    def retrieve(self, ids):
+        points = self.client.retrieve(collection_name=self.collection_name, ids=list(ids), with_payload=True)
+        return [Hit(p.id, 0.0, p.payload) for p in points]
+
+    def points(self, batch_size=1024):
+        offset = None
+        while True:
+            records, offset = self.client.scroll(collection_name=self.collection_name, limit=batch_size,
+                                                 offset=offset, with_payload=True, with_vectors=True)
+            for record in records:
+                yield record.id, record.vector, record.payload
+            if offset is None:
+                break
+
+    def search(self, vector, limit):
+        results = self.client.query_points(
+            collection_name=self.collection_name,
+            query=list(map(float, vector)),
+            limit=limit,
+            search_params=self.search_params,
+        )
+        return [Hit(p.id, p.score, p.payload) for p in results.points]
+
+    def search_batch(self, vectors, limits):
+        requests = [
+            self.models.QueryRequest(query=list(map(float, vector)), limit=limit, with_payload=True,
+                                     params=self.search_params)
+            for vector, limit in zip(vectors, limits)
+        ]
+        responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [[Hit(p.id, p.score, p.payload) for p in r.points] for r in responses]
+
+    def close(self):
+        self.client.close()
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+# +/-1 sign of each of the 8 bits (most significant first, as packbits writes them) of every byte
+_BYTE_SIGNS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(np.float32) * 2 - 1
+
+def quantize(vectors, quantization):
+    """(codes, scale) for unit vectors; scale is the per-dimension int8 step."""
+    if quantization == "int8":
+        peak = np.abs(vectors).max(axis=0) if len(vectors) else np.ones(VECTOR_SIZE, np.float32)
+        scale = np.maximum(peak, 1e-12) / 127
+        codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return codes, scale.astype(np.float32)
+    if quantization == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+class NumpyStore(VectorStore):
+    """Brute-force store: unit-normalized float32 rows in a memory-mapped .npy.
+
+    Payloads and IDs live in a JSON file alongside. Top-k is one matrix
+    product plus argpartition, which beats an ANN index at book scale.
+    Writes are applied in memory and written atomically by flush().
+
+    With `quantization`, int8 or sign-bit codes are held in RAM for the first
+    pass and only the `limit * oversampling` best candidates are rescored
+    against the memory-mapped float32 rows.
+
+    A `read_only` store never copies the mapped rows, so processes forked
+    after opening it share one copy of the index in the page cache.
+    """
+
+    # Rows scored per step in the quantized pass, bounding temporary memory
+    BLOCK_ROWS = 65536
+
+    def __init__(self, path=NUMPY_STORE_PATH, quantization=QUANTIZATION, oversampling=RESCORE_OVERSAMPLING,
+                 read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.quantization = quantization
+        self.oversampling = oversampling or DEFAULT_OVERSAMPLING[quantization]
+        self.vectors_path = os.path.join(path, "vectors.npy")
+        self.payloads_path = os.path.join(path, "payloads.json")
+        self.codes_path = os.path.join(path, f"vectors.{quantization}.npz")
+        self.load()
+
+    def exists(self):
+        return os.path.exists(self.vectors_path) and os.path.exists(self.payloads_path)
+
+    def load(self):
+        if self.exists():
+            self.vectors = np.load(self.vectors_path, mmap_mode="r")
+            with open(self.payloads_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.ids, self.payloads = data["ids"], data["payloads"]
+        else:
+            self.vectors = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+            self.ids, self.payloads = [], []
+        self.rows = {point_id: row for row, point_id in enumerate(self.ids)}
+        self.dirty = False
+        self.codes = self.scale = None
+        if self.quantization != "none":
+            if os.path.exists(self.codes_path):
+                with np.load(self.codes_path) as data:
+                    self.codes = data["codes"]
+                    self.scale = data["scale"] if self.quantization == "int8" else None
+            else:
+                self.codes, self.scale = quantize(np.asarray(self.vectors), self.quantization)
+
+    def _writable(self):
+        if self.read_only:
+            raise PermissionError(f"{self.path} is a read-only snapshot")
+        if not self.dirty:
+            self.vectors = np.array(self.vectors)
+            # Codes are rebuilt on flush; until then searches use exact scores
+            self.codes = self.scale = None
+            self.dirty = True
+
+    def resident_bytes(self):
+        """Bytes the first-pass search keeps in memory."""
+        if self.codes is not None:
+            return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+        return self.vectors.nbytes
+
+    def reset(self):
+        self.vectors = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self.ids, self.payloads, self.rows = [], [], {}
+        self.dirty = True
+        self.flush()
+
+    def upsert(self, points):
+        self._writable()
+        appended = []
+        for point_id, vector, payload in points:
+            row = self.rows.get(point_id)
+            if row is None:
+                self.rows[point_id] = len(self.ids)
+                self.ids.append(point_id)
+                self.payloads.append(payload)
+                appended.append(vector)
+            else:
+                self.vectors[row] = _normalize(vector)
+                self.payloads[row] = payload
+        if appended:
+            self.vectors = np.vstack([self.vectors, _normalize(appended)])
+
+    def delete(self, ids):
+        drop = {self.rows[i] for i in ids if i in self.rows}
+        if not drop:
+            return
+        self._writable()
+        keep = [row for row in range(len(self.ids)) if row not in drop]
+        self.vectors = self.vectors[keep]
+        self.ids = [self.ids[row] for row in keep]
+        self.payloads = [self.payloads[row] for row in keep]
+        self.rows = {point_id: row for row, point_id in enumerate(self.ids)}
+
+    def flush(self):
+        if not self.dirty:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # Write to temp files and swap, so readers never see a half-written store
+        tmp_vectors = self.vectors_path + ".tmp.npy"
+        np.save(tmp_vectors, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        tmp_payloads = self.payloads_path + ".tmp"
+        with open(tmp_payloads, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "payloads": self.payloads}, f, separators=(",", ":"))
+        if self.quantization != "none":
+            codes, scale = quantize(np.asarray(self.vectors), self.quantization)
+            tmp_codes = self.codes_path + ".tmp.npz"
+            np.savez(tmp_codes, codes=codes, scale=scale if scale is not None else np.zeros(0, np.float32))
+            os.replace(tmp_codes, self.codes_path)
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_payloads, self.payloads_path)
+        self.load()
+
+    def count(self):
+        return len(self.ids)
+
+    def retrieve(self, ids):
+        return [Hit(i, 0.0, self.payloads[self.rows[i]]) for i in ids if i in self.rows]
+
+    def points(self, batch_size=1024):
+        for start in range(0, len(self.ids), batch_size):
+            vectors = np.asarray(self.vectors[start:start + batch_size])
+            yield from zip(self.ids[start:start + batch_size], vectors, self.payloads[start:start + batch_size])
+
+    def _approximate_scores(self, queries):
+        """First-pass scores from the quantized codes (higher is better)."""
+        n = len(self.ids)
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        if self.quantization == "int8":
+            scaled = queries * self.scale
+            for start in range(0, n, self.BLOCK_ROWS):
+                block = self.codes[start:start + self.BLOCK_ROWS].astype(np.float32)
+                scores[:, start:start + len(block)] = scaled @ block.T
+        elif len(queries) >= 8:
+            # Asymmetric: the float query against +/-1 signs keeps more recall than
+            # Hamming distance. Batches amortise unpacking the signs.
+            for start in range(0, n, self.BLOCK_ROWS):
+                bits = np.unpackbits(self.codes[start:start + self.BLOCK_ROWS], axis=1, count=VECTOR_SIZE)
+                signs = bits.astype(np.float32) * 2 - 1
+                scores[:, start:start + len(signs)] = queries @ signs.T
+        else:
+            # Same scores for a few queries: a table holds the partial dot product for
+            # every possible byte at every byte position, so scoring is a gather.
+            positions = np.arange(self.codes.shape[1])
+            for i, query in enumerate(queries):
+                tables = query.reshape(-1, 8) @ _BYTE_SIGNS.T
+                for start in range(0, n, self.BLOCK_ROWS):
+                    block = self.codes[start:start + self.BLOCK_ROWS]
+                    scores[i, start:start + len(block)] = tables[positions, block].sum(axis=1)
+        return scores
+
+    def search_batch(self, vectors, limits):
+        if not self.ids:
+            return [[] for _ in limits]
+        queries = np.atleast_2d(_normalize(vectors))
+        quantized = self.codes is not None
+        scores = self._approximate_scores(queries) if quantized else queries @ self.vectors.T
+        output = []
+        for query, row_scores, limit in zip(queries, scores, limits):
+            k = min(limit, len(self.ids))
+            if k <= 0:
+                output.append([])
+                continue
+            candidates = min(len(self.ids), math.ceil(k * self.oversampling)) if quantized else k
+            top = np.argpartition(-row_scores, candidates - 1)[:candidates]
+            if quantized:
+                # Rescore candidates against the full-precision rows on disk
+                top = np.sort(top)
+                top_scores = self.vectors[top] @ query
+            else:
+                top_scores = row_scores[top]
+            order = np.argsort(-top_scores)[:k]
+            output.append([Hit(self.ids[top[i]], float(top_scores[i]), self.payloads[top[i]]) for i in order])
+        return output
+
+def write_snapshot(store, path=SNAPSHOT_PATH, quantization=QUANTIZATION, extra_files=()):
+    """Copy any store into a fresh NumPy snapshot directory and swap it in atomically.
+
+    `extra_files` (e.g. the lexical index) are copied alongside so the
+    snapshot is self-consistent. Processes still serving the old snapshot
+    keep their mappings; they pick up the new one when restarted.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    snapshot = NumpyStore(tmp_path, quantization=quantization)
+    snapshot.upsert(list(store.points()))
+    snapshot.flush()
+    for extra in extra_files:
+        shutil.copy2(extra, os.path.join(tmp_path, os.path.basename(extra)))
+
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return snapshot.count()
+
+def open_snapshot(path=SNAPSHOT_PATH, quantization=QUANTIZATION):
+    return NumpyStore(path, quantization=quantization, read_only=True)
+
+def open_store(backend=VECTOR_BACKEND, **options):
+    if backend == "qdrant":
+        return QdrantStore(**options)
+    if backend == "numpy":
+        return NumpyStore(**options)
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The services import their modules by bare name from their own directories
+for directory in ("", "rag_chatbot", "backend", os.path.join("book", "api")):
+    sys.path.insert(0, os.path.join(ROOT, directory))
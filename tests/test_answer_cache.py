@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from index import RETRIEVAL_ARTIFACT, AnswerCache, RetrievalArtifact
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+# Static bag-of-words style vectors: the shared words dominate, so the two
+# questions about different parts are over 0.97 cosine-similar
+KNEE = unit([1.0, 1.0, 1.0, 0.3, 0.0])
+HIP = unit([1.0, 1.0, 1.0, 0.0, 0.3])
+
+def test_similar_questions_about_different_parts_do_not_share_an_answer():
+    cache = AnswerCache()
+    assert float(KNEE @ HIP) > cache.threshold
+    cache.set("v1", "How does the knee motor of a humanoid robot work?", KNEE, "Knee answer")
+
+    assert cache.get("v1", "How does the hip motor of a humanoid robot work?", HIP) is None
+
+@pytest.mark.skipif(not RETRIEVAL_ARTIFACT.exists(), reason="needs the artifact from rag_chatbot/export_artifact.py")
+def test_paraphrase_embedded_through_the_artifact_hits():
+    artifact = RetrievalArtifact(RETRIEVAL_ARTIFACT)
+    cache = AnswerCache()
+    cache.set("v1", "How do humanoids balance?", artifact.embed_query("How do humanoids balance?"), "Balance answer")
+
+    paraphrase = "How does a humanoid robot keep balance?"
+    assert cache.get("v1", paraphrase, artifact.embed_query(paraphrase)) == "Balance answer"
+
+def test_empty_answers_are_not_cached():
+    cache = AnswerCache()
+    cache.set("v1", "What is a gait cycle?", KNEE, "")
+    cache.set("v1", "What is a gait cycle?", KNEE, "  \n")
+
+    assert cache.get("v1", "What is a gait cycle?", KNEE) is None
+    assert not cache.entries
@@ -0,0 +1,22 @@
+import os
+from caches import ResponseCache
+
+KEY = ("v1", "what is a zmp", 5, "hybrid")
+
+def test_forked_workers_open_their_own_disk_connection(tmp_path):
+    cache = ResponseCache(maxsize=8, path=str(tmp_path / "responses.sqlite"))
+    cache.set(KEY, b"parent")
+    parent_conn = cache.conn
+
+    pid = os.fork()
+    if pid == 0:
+        cache.memory.clear()
+        ok = cache.get(KEY) == b"parent" and cache.conn is not parent_conn
+        cache.set(("v1", "what is a gait", 5, "hybrid"), b"child")
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert cache.conn is parent_conn
+    cache.memory.clear()
+    assert cache.get(("v1", "what is a gait", 5, "hybrid")) == b"child"
@@ -0,0 +1,17 @@
+import pytest
+from embeddings import MODEL_NAME, check_parity
+
+def model_is_cached(model_name=MODEL_NAME):
+    """Whether SentenceTransformer can load the model without the network."""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return False
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    return isinstance(try_to_load_from_cache(repo, "config.json"), str)
+
+@pytest.mark.skipif(not model_is_cached(), reason=f"{MODEL_NAME} is not in the local Hugging Face cache")
+@pytest.mark.parametrize("engine", ["onnx", "onnx-int8"])
+def test_onnx_engine_matches_torch_embeddings(engine):
+    pytest.importorskip("onnxruntime")
+    assert check_parity(engine)
@@ -0,0 +1,38 @@
+import os
+import asyncio
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from shared.metrics import IN_FLIGHT, REQUEST_SECONDS, instrument
+
+def test_streamed_responses_are_timed_until_the_body_ends():
+    app = instrument(FastAPI())
+    in_flight_while_streaming = []
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                in_flight_while_streaming.append(IN_FLIGHT.values[()])
+                yield b"tick\n"
+        return StreamingResponse(body())
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/stream")
+
+    assert asyncio.run(run()).text == "tick\n" * 3
+    series = REQUEST_SECONDS.series[("GET", "/stream", 200)]
+    assert series[-1] == 1 and series[-2] >= 0.15
+    assert in_flight_while_streaming == [1.0] * 3
+    assert IN_FLIGHT.values[()] == 0
+
+def test_vercel_copy_matches_shared_module():
+    # The Vercel function can only import files under book/, so it ships its own copy
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, "shared", "metrics.py"), encoding="utf-8") as f:
+        shared = f.read()
+    with open(os.path.join(root, "book", "api", "_metrics.py"), encoding="utf-8") as f:
+        assert f.read() == shared, "copy shared/metrics.py to book/api/_metrics.py"
@@ -0,0 +1,87 @@
+import time
+import asyncio
+import threading
+import httpx
+import api
+from batching import MicroBatcher
+from caches import LRUCache
+
+class EmptyStore:
+    def search(self, vector, limit):
+        return []
+
+def test_search_sheds_load_once_the_micro_batch_queue_is_full(monkeypatch):
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(5)
+        return [[1.0, 0.0]] * len(texts)
+
+    # A queue deeper than the threadpool (40 threads): only requests that wait
+    # without holding a thread can fill it
+    monkeypatch.setattr(api, "batcher", MicroBatcher(encode, max_batch_size=1, max_wait=0, max_queue=64))
+    monkeypatch.setattr(api, "store", EmptyStore())
+    monkeypatch.setattr(api, "response_cache", None)
+    monkeypatch.setattr(api, "query_cache", LRUCache(maxsize=0))
+    monkeypatch.setitem(api.startup, "state", "ready")
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            requests = [asyncio.create_task(client.post("/search", json={"query": f"question {i}"}))
+                        for i in range(100)]
+            deadline = time.monotonic() + 5
+            while not api.batcher.rejected and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            release.set()
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(run())
+    statuses = [response.status_code for response in responses]
+
+    assert statuses.count(503) == api.batcher.rejected > 0
+    assert statuses.count(200) == 100 - api.batcher.rejected
+    assert all(r.headers["Retry-After"] == "1" for r in responses if r.status_code == 503)
+
+def test_search_rejects_out_of_range_limits(monkeypatch):
+    monkeypatch.setitem(api.startup, "state", "ready")
+    transport = httpx.ASGITransport(app=api.app)
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            single = [await client.post("/search", json={"query": "balance", "limit": limit})
+                      for limit in (-1, 0, api.MAX_LIMIT + 1)]
+            batch = await client.post("/search/batch", json={"queries": [{"query": "balance", "limit": 0}]})
+            return single + [batch]
+
+    assert [response.status_code for response in asyncio.run(run())] == [422] * 4
+
+def test_search_survives_a_client_giving_up_while_queued(monkeypatch):
+    release = threading.Event()
+
+    def encode(texts):
+        release.wait(5)
+        return [[1.0, 0.0]] * len(texts)
+
+    monkeypatch.setattr(api, "batcher", MicroBatcher(encode, max_batch_size=1, max_wait=0, max_queue=8))
+    monkeypatch.setattr(api, "store", EmptyStore())
+    monkeypatch.setattr(api, "response_cache", None)
+    monkeypatch.setattr(api, "query_cache", LRUCache(maxsize=0))
+    monkeypatch.setitem(api.startup, "state", "ready")
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # The first request occupies the worker; the second waits in the queue and is abandoned
+            first = asyncio.create_task(client.post("/search", json={"query": "first"}))
+            abandoned = asyncio.create_task(client.post("/search", json={"query": "abandoned"}))
+            while api.batcher.stats()["queue_depth"] < 1:
+                await asyncio.sleep(0.01)
+            abandoned.cancel()
+            await asyncio.sleep(0.05)
+            release.set()
+            assert (await first).status_code == 200
+            return await asyncio.wait_for(client.post("/search", json={"query": "next"}), 5)
+
+    assert asyncio.run(run()).status_code == 200
+    assert api.batcher._worker.is_alive()
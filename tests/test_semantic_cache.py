@@ -0,0 +1,23 @@
+import numpy as np
+from semantic_cache import SemanticCache
+
+def vector(dim, seed=0):
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+
+def test_switching_embedding_model_drops_incomparable_entries(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    fake = SemanticCache(path=path, model="fake")
+    fake.set("chat", "what is a zmp", vector(512), "Zero moment point.")
+    fake.conn.close()
+
+    cache = SemanticCache(path=path, model="models/text-embedding-004")
+    assert len(cache) == 0
+    assert cache.get("chat", vector(768)) is None
+    cache.set("chat", "what is a zmp", vector(768, seed=1), "The zero moment point.")
+    assert cache.get("chat", vector(768, seed=1))[0] == "The zero moment point."
+
+def test_lookup_with_a_vector_of_another_dimension_is_a_miss():
+    cache = SemanticCache(model="fake")
+    cache.set("chat", "what is a zmp", vector(512), "Zero moment point.")
+    assert cache.get("chat", vector(768)) is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,22 @@
+import asyncio
+from single_flight import SingleFlight
+
+def test_request_arriving_after_everyone_left_starts_a_fresh_flight():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def produce():
+            await asyncio.sleep(0.01)
+            yield "answer"
+
+        abandoned = flights.join("key", produce)
+        abandoned.leave()  # the only client disconnects: the generation is cancelled
+        flight = flights.join("key", produce)  # ...while an identical request arrives
+        try:
+            answer = await asyncio.wait_for(flight.result(), timeout=1)
+        finally:
+            flight.leave()
+        await asyncio.sleep(0)
+        return flight is not abandoned, answer, flights.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == (True, "answer", 0)